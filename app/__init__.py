@@ -3,14 +3,16 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from flask_marshmallow import Marshmallow
-from flask_sqlalchemy import SQLAlchemy
+
+from app.database import Database
+from app.dispatch import Mailer
 
 app = Flask(__name__)
 app.config.from_object('config')
 app.config.from_object('secret')
 
 # flask_sqlalchemy for database connections
-db = SQLAlchemy(app)
+db = Database(app)
 
 # flask_marschmallow for object serialization/deserialization
 ma = Marshmallow(app)
@@ -21,20 +23,27 @@ jwt = JWTManager(app)
 # flask_mail for email
 mail = Mail(app)
 
+# mailer for background email delivery
+mailer = Mailer(app, mail)
+
 # flask_cors for CORS
 cors = CORS(app)
 
 # Avoid circular import: views need app variable
 from app.admin import admin_blueprint
 from app.api import api_blueprint
+from app.metrics import metrics_blueprint
 from app.token import token_blueprint
 
 app.register_blueprint(admin_blueprint)
 app.register_blueprint(api_blueprint)
+app.register_blueprint(metrics_blueprint)
 app.register_blueprint(token_blueprint)
 
 # Avoid circular import: models need app variable
 import app.models as models
+import app.identity as identity
+import app.instrumentation as instrumentation
 
 
 @jwt.user_lookup_loader
@@ -43,6 +52,9 @@ def load_user(jwt_header, jwt_payload):
     The callback for reloading a user from the session.
     """
     try:
-        return models.User.query.get(int(jwt_payload[app.config['JWT_IDENTITY_CLAIM']]))
+        return identity.load_user(int(jwt_payload[app.config['JWT_IDENTITY_CLAIM']]))
     except ValueError:
         return None
+
+# Avoid circular import: commands need models
+import app.commands as commands
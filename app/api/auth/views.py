@@ -7,7 +7,9 @@ from flask_restful import Resource
 from app import db
 from app import emails
 from app.api import api
+from app.identity import invalidate_user
 from app.models import User
+from app.security import PasswordHasherBusy
 from .schema import LoginSchema, ActivateSchema, ResetSchema
 
 login_schema = LoginSchema()
@@ -30,10 +32,24 @@ class LoginResource(Resource):
 
         user = User.get_by_email(email)
 
-        if user and user.check_password(password):
+        try:
+            is_valid = user and user.check_password(password)
+        except PasswordHasherBusy as err:
+            return {'msg': err.description}, 503
+
+        if is_valid:
             if not user.is_activated:
                 return {'msg': 'Activeer je account'}, 403
 
+            if user.needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.add(user)
+                    db.session.commit()
+                except PasswordHasherBusy:
+                    # The password is correct, the rehash waits for the next login
+                    pass
+
             access_token = jwt.create_access_token(identity=user.id)
             refresh_token = jwt.create_refresh_token(identity=user.id)
             response = jsonify({
@@ -92,6 +108,7 @@ class ActivateResource(Resource):
         user.is_sharing = data.get('isSharing')
         db.session.add(user)
         db.session.commit()
+        invalidate_user(user)
 
         emails.send_activation(user)
         return {'success': True}, 200
@@ -1,7 +1,33 @@
+import collections
+
 import sqlalchemy as sqla
 
-from app import db
-from app.models import BreadOrder, BreadOrderDate
+from app import app, db
+from app.cache import create_cache
+from app.models import BreadOrder, BreadOrderCount, BreadOrderDate, BreadType
+from app.response_cache import generations, invalidate_model, watch_models
+
+report_cache = create_cache(
+    app,
+    'bread-report',
+    ttl=app.config['BREAD_REPORT_CACHE_TTL'],
+    size=app.config['BREAD_REPORT_CACHE_SIZE']
+)
+
+# The models of which the writes invalidate the cached reports
+REPORT_MODELS = (BreadOrder, BreadType)
+watch_models(REPORT_MODELS)
+
+
+def get_semester(day):
+    """
+    Returns the first and last day of the semester containing the given day.
+    The first semester runs from September to December, the second one from
+    January to August.
+    """
+    if day.month >= 9:
+        return day.replace(month=9, day=1), day.replace(month=12, day=31)
+    return day.replace(month=1, day=1), day.replace(month=8, day=31)
 
 
 def get_order_dates(after_date):
@@ -26,30 +52,47 @@ def get_orders(user, after_date):
 
 def get_order_dates_extended(user, after_date):
     """
-    Returns for all order dates the orders of a user after a given date.
+    Returns for all order dates the orders of a user after a given date. The
+    total price per date is computed by the database, so the dates and orders
+    are loaded in two queries.
     """
+    totals = db.session.query(
+        BreadOrder.date_id.label('date_id'),
+        sqla.func.sum(BreadType.price).label('total_price')
+    ).join(BreadType, BreadOrder.type_id == BreadType.id) \
+     .filter(BreadOrder.user_id == user.id) \
+     .group_by(BreadOrder.date_id) \
+     .subquery()
+
+    query = db.session.query(
+        BreadOrderDate,
+        sqla.func.coalesce(totals.c.total_price, 0)
+    ).outerjoin(totals, totals.c.date_id == BreadOrderDate.id) \
+     .filter(BreadOrderDate.date > after_date) \
+     .order_by(BreadOrderDate.date, BreadOrderDate.id)
+
     result = {}
-    dates = get_order_dates(after_date)
-    for order_date in dates:
+    for order_date, total_price in query:
         result[order_date.id] = {
             'id': order_date.id,
             'date': order_date.date,
             'is_active': order_date.is_active,
             'is_editable': order_date.is_editable,
             'orders': [],
-            'total_price': 0
+            'total_price': total_price
         }
 
-    orders = get_orders(user, after_date)
-    for order in orders:
-        if order.date.id not in result:
-            continue
-        data = result[order.date.id]
-        data['orders'].append({
-            'id': order.id,
-            'type': order.type.name
+    query = db.session.query(BreadOrder.id, BreadOrder.date_id, BreadType.name) \
+                      .join(BreadType, BreadOrder.type_id == BreadType.id) \
+                      .join(BreadOrderDate, BreadOrder.date_id == BreadOrderDate.id) \
+                      .filter(BreadOrderDate.date > after_date) \
+                      .filter(BreadOrder.user_id == user.id) \
+                      .order_by(BreadOrder.id)
+    for order_id, date_id, type_name in query:
+        result[date_id]['orders'].append({
+            'id': order_id,
+            'type': type_name
         })
-        data['total_price'] += order.type.price
     return result.values()
 
 
@@ -71,52 +114,154 @@ def get_week_order_detailed(date):
 
 def get_week_order_totals(date):
     """
-    Get the totals for the order for a certain week.
+    Get the totals for the order for a certain week, looked up in the
+    maintained order counts.
     """
     query = sqla.text("""
-        SELECT bt.id, bt.name, COUNT(bod.id)
-        FROM bread_order_date AS bod
-        JOIN bread_order AS bo ON bod.id = bo.date_id
-        JOIN bread_type AS bt ON bo.type_id = bt.id
-        WHERE bod.id = :date
-        GROUP BY(bt.id)
+        SELECT bt.id, bt.name, boc.count
+        FROM bread_order_count AS boc
+        JOIN bread_type AS bt ON boc.type_id = bt.id
+        WHERE boc.date_id = :date AND boc.count > 0
         ORDER BY bt.id
     """)
     return db.session.execute(query, {"date": date.id})
 
 
-def add_orders_on(user, order_date, items):
+def stream_week_orders(date, batch_size=500):
     """
-    Adds for a user all orders specified by items on the specified date.
+    Returns the orders of a certain week as (corridor, room, first name, last
+    name, bread type, count) rows, ordered by corridor, room and user. The
+    rows are fetched in batches with a server-side cursor where the database
+    supports it.
     """
-    for item in items:
-        order = BreadOrder(
-            user=user,
-            date=order_date,
-            type=item
-        )
-        db.session.add(order)
+    query = sqla.text("""
+        SELECT "user".corridor, "user".room, "user".first_name,
+               "user".last_name, bt.name, COUNT(bo.id)
+        FROM bread_order AS bo
+        JOIN "user" ON bo.user_id = "user".id
+        JOIN bread_type AS bt ON bo.type_id = bt.id
+        WHERE bo.date_id = :date
+        GROUP BY "user".id, "user".corridor, "user".room, "user".first_name,
+                 "user".last_name, bt.id, bt.name
+        ORDER BY COALESCE("user".corridor, ''), "user".room, "user".id, bt.id
+    """).execution_options(stream_results=True)
+    return db.session.execute(query, {"date": date.id}).yield_per(batch_size)
+
+
+def get_order_report(start_date, end_date):
+    """
+    Returns the number of orders and the revenue per bread type for every
+    order date between the given dates (inclusive), computed by a single
+    grouped query over the maintained order counts. Reports are cached per
+    range until an order or a bread type is written.
+    """
+    cache_key = ('report', start_date, end_date, generations(REPORT_MODELS))
+    report = report_cache.get(cache_key)
+    if report is not None:
+        return report
+
+    query = db.session.query(
+        BreadOrderDate.date,
+        BreadType.id,
+        BreadType.name,
+        sqla.func.sum(BreadOrderCount.count),
+        sqla.func.sum(BreadOrderCount.count * BreadType.price)
+    ).join(BreadOrderCount, BreadOrderCount.date_id == BreadOrderDate.id) \
+     .join(BreadType, BreadOrderCount.type_id == BreadType.id) \
+     .filter(BreadOrderDate.date.between(start_date, end_date)) \
+     .filter(BreadOrderCount.count > 0) \
+     .group_by(BreadOrderDate.date, BreadType.id, BreadType.name) \
+     .order_by(BreadOrderDate.date, BreadType.id)
+    rows = query.all()
+
+    # The columns of the matrix are the bread types ordered in the range
+    types = sorted(set((type_id, name) for _, type_id, name, _, _ in rows))
+    columns = dict((type_id, i) for i, (type_id, _) in enumerate(types))
+
+    dates = collections.OrderedDict()
+    for date, type_id, _, count, revenue in rows:
+        entry = dates.get(date)
+        if entry is None:
+            entry = dates[date] = {
+                'date': date.isoformat(),
+                'counts': [0] * len(types),
+                'revenue': 0
+            }
+        entry['counts'][columns[type_id]] += count
+        entry['revenue'] += revenue or 0
+
+    report = {
+        'from': start_date.isoformat(),
+        'to': end_date.isoformat(),
+        'types': [name for _, name in types],
+        'dates': list(dates.values()),
+        'totals': {
+            'counts': [
+                sum(entry['counts'][i] for entry in dates.values())
+                for i in range(len(types))
+            ],
+            'revenue': sum(entry['revenue'] for entry in dates.values())
+        }
+    }
+    report_cache.set(cache_key, report)
+    return report
+
+
+def add_orders_on(user, order_date, type_ids):
+    """
+    Adds for a user all orders specified by the bread type ids on the specified
+    date.
+    """
+    if type_ids:
+        db.session.execute(BreadOrder.__table__.insert(), [
+            {'user_id': user.id, 'date_id': order_date.id, 'type_id': type_id}
+            for type_id in type_ids
+        ])
     db.session.commit()
+    if type_ids:
+        invalidate_model(BreadOrder)
 
 
-def add_orders_after(user, after_date, items):
+def add_orders_after(user, after_date, type_ids):
     """
-    Adds for a user all orders specified by items on all editable order dates
-    after the specified date.
+    Adds for a user all orders specified by the bread type ids on all editable
+    order dates after the specified date. Orders the user already has on a
+    date are not added again, so repeating the same request adds nothing.
+    Returns the number of added orders.
     """
-    order_dates = get_order_dates(after_date)
-    for order_date in order_dates:
-        if not order_date.is_editable:
-            continue
+    wanted = collections.Counter(type_ids)
+    if not wanted:
+        return 0
+
+    # The editable dates with the number of orders per type of the user
+    query = db.session.query(
+        BreadOrderDate.id,
+        BreadOrder.type_id,
+        sqla.func.count(BreadOrder.id)
+    ).outerjoin(BreadOrder, sqla.and_(
+        BreadOrder.date_id == BreadOrderDate.id,
+        BreadOrder.user_id == user.id
+    )).filter(
+        BreadOrderDate.date > after_date,
+        BreadOrderDate.is_editable
+    ).group_by(BreadOrderDate.id, BreadOrder.type_id)
+
+    existing = collections.defaultdict(collections.Counter)
+    for date_id, type_id, count in query:
+        existing[date_id][type_id] = count
 
-        for item in items:
-            order = BreadOrder(
-                user=user,
-                date=order_date,
-                type=item
-            )
-            db.session.add(order)
+    rows = [
+        {'user_id': user.id, 'date_id': date_id, 'type_id': type_id}
+        for date_id, counts in existing.items()
+        for type_id, count in wanted.items()
+        for _ in range(count - counts[type_id])
+    ]
+    if rows:
+        db.session.execute(BreadOrder.__table__.insert(), rows)
     db.session.commit()
+    if rows:
+        invalidate_model(BreadOrder)
+    return len(rows)
 
 
 def delete_orders_on(user, order_date):
@@ -128,16 +273,82 @@ def delete_orders_on(user, order_date):
         BreadOrder.date_id == order_date.id
     ).delete()
     db.session.commit()
+    invalidate_model(BreadOrder)
 
 
 def delete_orders_after(user, after_date):
     """
-    Deletes for a user all editable orders after the specified date.
+    Deletes for a user all editable orders after the specified date in a
+    single statement. Returns the number of deleted orders.
+    """
+    editable_dates = sqla.select(BreadOrderDate.id).where(
+        BreadOrderDate.date > after_date,
+        BreadOrderDate.is_editable
+    )
+    deleted = db.session.query(BreadOrder).filter(
+        BreadOrder.user_id == user.id,
+        BreadOrder.date_id.in_(editable_dates)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        invalidate_model(BreadOrder)
+    return deleted
+
+
+def count_orders():
+    """
+    Returns a select of the actual number of orders per order date and bread
+    type.
     """
-    orders = get_orders(user, after_date)
-    for order in orders:
-        if not order.date.is_editable:
-            continue
+    return sqla.select(
+        BreadOrder.date_id,
+        BreadOrder.type_id,
+        sqla.func.count(BreadOrder.id).label('count')
+    ).where(
+        BreadOrder.date_id.isnot(None),
+        BreadOrder.type_id.isnot(None)
+    ).group_by(BreadOrder.date_id, BreadOrder.type_id)
 
-        db.session.delete(order)
+
+def rebuild_order_counts():
+    """
+    Replaces the maintained order counts by the actual number of orders.
+    Returns the number of counted (date, type) pairs.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # Orders written during the rebuild would be counted twice or lost
+        db.session.execute(sqla.text('LOCK TABLE bread_order IN SHARE MODE'))
+    db.session.execute(BreadOrderCount.__table__.delete())
+    counts = count_orders()
+    result = db.session.execute(
+        BreadOrderCount.__table__.insert().from_select(
+            ['date_id', 'type_id', 'count'], counts
+        )
+    )
     db.session.commit()
+    invalidate_model(BreadOrder)
+    return result.rowcount
+
+
+def find_order_count_drift():
+    """
+    Returns the (date id, type id, maintained count, actual count) of the
+    maintained order counts which differ from the actual number of orders.
+    """
+    actual = dict(
+        ((date_id, type_id), count)
+        for date_id, type_id, count in db.session.execute(count_orders())
+    )
+    stored = dict(
+        ((date_id, type_id), count)
+        for date_id, type_id, count in db.session.query(
+            BreadOrderCount.date_id,
+            BreadOrderCount.type_id,
+            BreadOrderCount.count
+        )
+    )
+    return sorted(
+        key + (stored.get(key, 0), actual.get(key, 0))
+        for key in set(actual) | set(stored)
+        if stored.get(key, 0) != actual.get(key, 0)
+    )
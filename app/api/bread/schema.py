@@ -35,7 +35,7 @@ class BreadOrderDates(ma.Schema):
 class BreadOrderingSchema(ma.Schema):
     items = fields.List(
         fields.Function(
-            deserialize=lambda item: BreadType.from_name(item),
+            deserialize=BreadType.id_from_name,
             validate=validate_not_none
         ),
         required=True
@@ -6,6 +6,7 @@ from flask import request
 from flask_restful import Resource
 
 from app.api import api
+from app.response_cache import cached_response
 from app.models import BreadType, BreadOrderDate
 from . import queries
 from .schema import BreadOrderDates, BreadOrderingSchema, BreadTypeSchema
@@ -17,11 +18,7 @@ bread_types_schema = BreadTypeSchema(many=True)
 
 def get_start_date():
     # TODO: solve start_date hack
-    start_date = datetime.date.today()
-    if start_date.month >= 9:
-        start_date = start_date.replace(month=9, day=1)
-    else:
-        start_date = start_date.replace(month=1, day=1)
+    start_date, _ = queries.get_semester(datetime.date.today())
     return start_date
 
 
@@ -84,21 +81,22 @@ class BreadAllOrderDatesResource(Resource):
 
         user = jwt.current_user
         start_date = get_start_date()
-        queries.add_orders_after(user, start_date, data.get('items'))
-        return {'success': True}
+        added = queries.add_orders_after(user, start_date, data.get('items'))
+        return {'success': True, 'added': added}
 
     @jwt.jwt_required()
     def delete(self):
         user = jwt.current_user
         start_date = get_start_date()
-        queries.delete_orders_after(user, start_date)
-        return {'success': True}
+        deleted = queries.delete_orders_after(user, start_date)
+        return {'success': True, 'deleted': deleted}
 
 
 @api.resource('/bread/type')
 class BreadTypeResource(Resource):
 
     @jwt.jwt_required()
+    @cached_response('bread.types', models=[BreadType])
     def get(self):
         types = BreadType.query.all()
         data = bread_types_schema.dump(types)
@@ -2,7 +2,6 @@ from marshmallow import fields, ValidationError
 import datetime
 
 from app import ma
-from app.models import KotbarReservation
 
 
 def validate_date(date):
@@ -14,8 +13,6 @@ def validate_date(date):
                 min_date, max_date
             )
         )
-    if KotbarReservation.is_booked(date):
-        raise ValidationError('Date is already booked.')
 
 
 class ReservationSchema(ma.Schema):
@@ -7,11 +7,15 @@ from flask_restful import Resource
 
 from app import db
 from app import emails
+from app import mailer
 from app.api import api
+from app.api.sync import SyncSchema, make_etag, not_modified, sync_response
 from app.models import KotbarReservation
+from app.response_cache import invalidate_model
 from .schema import ReservationSchema, ReserveSchema
 
 reservations_schema = ReservationSchema(many=True)
+sync_schema = SyncSchema()
 reserve_schema = ReserveSchema()
 
 
@@ -20,15 +24,42 @@ class KotbarReservationListResource(Resource):
 
     @jwt.jwt_required()
     def get(self):
-        yesterday = datetime.date.today() - datetime.timedelta(1)
-        reservations = KotbarReservation.get_all_after(yesterday)
+        try:
+            params = sync_schema.load(request.args)
+        except ma.ValidationError as err:
+            return {'msg': '400 Bad Request', 'errors': err.messages}, 400
 
         user = jwt.current_user
+        start_date = params.get('start_date')
+        end_date = params.get('end_date')
+        since = params.get('updated_since')
+
+        # An unchanged listing is answered with a single query
+        version, last_modified = KotbarReservation.sync_state()
+        etag = make_etag('kotbar', user.id, start_date, end_date, since, version)
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+
+        reservations = KotbarReservation.get_all_after(
+            start_date - datetime.timedelta(1),
+            eager=True,
+            end_date=end_date,
+            since=since
+        )
+        deleted = [r.id for r in reservations if r.is_deleted]
+        reservations = [r for r in reservations if not r.is_deleted]
         for reservation in reservations:
-            reservation.own = user.id == reservation.user.id
+            reservation.own = user.id == reservation.user_id
 
         data = reservations_schema.dump(reservations)
-        return {'success': True, 'reservations': data}
+        return sync_response({
+            'success': True,
+            'reservations': data,
+            'deleted': deleted,
+            # The cursor for the next updated_since
+            'updated_since': version or 0
+        }, etag, last_modified)
 
     @jwt.jwt_required()
     def post(self):
@@ -40,16 +71,29 @@ class KotbarReservationListResource(Resource):
 
         user = jwt.current_user
 
-        reservation = KotbarReservation(
-            user_id=user.id,
-            date=data.get('date'),
-            description=data.get('description')
+        reservation = KotbarReservation.reserve(
+            user,
+            data.get('date'),
+            data.get('description')
         )
-        db.session.add(reservation)
+        if reservation is None:
+            db.session.rollback()
+            return {
+                'msg': '400 Bad Request',
+                'errors': {'date': ['Date is already booked.']}
+            }, 400
+        # The emails are rendered from the known values, before the commit
+        # expires the reservation and its user
+        messages = [
+            emails.prepare_kotbar_reservation(reservation),
+            emails.prepare_kotbar_reservation_admin(reservation)
+        ]
         db.session.commit()
+        # The reservation was inserted without the session noticing
+        invalidate_model(KotbarReservation)
 
-        emails.send_kotbar_reservation(reservation)
-        emails.send_kotbar_reservation_admin(reservation)
+        for msg in messages:
+            mailer.send(msg)
         return {'success': True}
 
 
@@ -60,9 +104,10 @@ class KotbarReservationResource(Resource):
     def delete(self, reservation_id):
         user = jwt.current_user
         reservation = KotbarReservation.query.get(reservation_id)
-        if not reservation or reservation.user.id != user.id:
+        if not reservation or reservation.is_deleted or reservation.user.id != user.id:
             return {'msg': '400 Bad Request'}, 400
 
-        db.session.delete(reservation)
+        # The tombstone tells syncing clients about the deletion
+        reservation.soft_delete()
         db.session.commit()
         return {'success': True}
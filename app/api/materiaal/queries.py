@@ -1,3 +1,7 @@
+import datetime
+
+import sqlalchemy as sqla
+
 from app import db
 from app.models import MaterialType, MaterialReservation, association_material_reservation_items
 
@@ -9,5 +13,59 @@ def get_items_booked_on_date(date):
     query = db.session.query(MaterialType.id) \
         .join(association_material_reservation_items) \
         .join(MaterialReservation) \
-        .filter(MaterialReservation.date == date)
+        .filter(MaterialReservation.date == date) \
+        .filter(MaterialReservation.deleted_at.is_(None))
     return list(map(lambda result: result[0], query.all()))
+
+
+def get_items_with_booked(item_ids, date):
+    """
+    Returns the material types with the given ids together with whether they
+    are booked on the given date, as (material type, booked) pairs in a
+    single query. Unknown ids are left out.
+    """
+    booked = sqla.exists() \
+        .where(association_material_reservation_items.c.type_id == MaterialType.id) \
+        .where(association_material_reservation_items.c.reservation_id == MaterialReservation.id) \
+        .where(MaterialReservation.date == date) \
+        .where(MaterialReservation.deleted_at.is_(None))
+    query = db.session.query(MaterialType, booked.label('booked')) \
+        .filter(MaterialType.id.in_(item_ids))
+    return query.all()
+
+
+def get_availability_between(start_date, end_date):
+    """
+    Returns the ids of all material types and a dictionary with for every date
+    between (and including) the given start and end date a string with for
+    every material type (in the same order) a '1' if it is still free and a
+    '0' if it is booked, in a single query.
+    """
+    booked = db.session.query(
+        MaterialReservation.date,
+        association_material_reservation_items.c.type_id
+    ).join(association_material_reservation_items) \
+     .filter(MaterialReservation.date.between(start_date, end_date)) \
+     .filter(MaterialReservation.deleted_at.is_(None)) \
+     .group_by(MaterialReservation.date, association_material_reservation_items.c.type_id) \
+     .subquery()
+    query = db.session.query(MaterialType.id, booked.c.date) \
+        .outerjoin(booked, booked.c.type_id == MaterialType.id) \
+        .order_by(MaterialType.id)
+
+    item_ids = []
+    booked_items = set()
+    for item_id, date in query:
+        if not item_ids or item_ids[-1] != item_id:
+            item_ids.append(item_id)
+        if date is not None:
+            booked_items.add((date, item_id))
+
+    availability = {}
+    for day in range((end_date - start_date).days + 1):
+        date = start_date + datetime.timedelta(day)
+        availability[date.isoformat()] = ''.join(
+            '0' if (date, item_id) in booked_items else '1'
+            for item_id in item_ids
+        )
+    return item_ids, availability
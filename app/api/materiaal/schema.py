@@ -1,16 +1,7 @@
-from marshmallow import fields, ValidationError, validates_schema
+from marshmallow import fields, ValidationError, validates_schema, post_load
 
-from app import ma
-from app.models import MaterialType
-from .queries import get_items_booked_on_date
-
-
-def validate_not_none(value):
-    """
-    Validates whether the given value is None.
-    """
-    if value is None:
-        raise ValidationError('Items contains an unknown material type')
+from app import app, ma
+from .queries import get_items_with_booked
 
 
 def validate_distinct(lst):
@@ -37,23 +28,53 @@ class ReservationSchema(ma.Schema):
 class ReserveSchema(ma.Schema):
     date = fields.Date(required=True)
     items = fields.List(
-        fields.Function(
-            deserialize=lambda item: MaterialType.query.get(item),
-            validate=validate_not_none
-        ),
+        fields.Integer(error_messages={
+            'invalid': 'Items contains an unknown material type'
+        }),
         required=True,
         validate=validate_distinct
     )
 
+    @post_load
+    def resolve_items(self, data, **kwargs):
+        """
+        Replaces the item ids by their material types. Validates the items on
+        unknown material types and duplicate bookings in a single query.
+        """
+        items = dict(
+            (item.id, (item, booked))
+            for item, booked in get_items_with_booked(data['items'], data['date'])
+        )
+        unknown = dict(
+            (index, ['Items contains an unknown material type'])
+            for index, item_id in enumerate(data['items']) if item_id not in items
+        )
+        if unknown:
+            # Reported per index, like the errors of the list items
+            raise ValidationError(unknown, 'items')
+        if any(booked for _, booked in items.values()):
+            raise ValidationError('Items contains a previously booked item')
+        data['items'] = [items[item_id][0] for item_id in data['items']]
+        return data
+
+
+class AvailabilitySchema(ma.Schema):
+    start_date = fields.Date(required=True, data_key='from')
+    end_date = fields.Date(required=True, data_key='to')
+
     @validates_schema
-    def validate_schema(self, data, **kwargs):
+    def validate_range(self, data, **kwargs):
         """
-        Validates this schema on duplicate bookings.
+        Validates whether the range is not reversed or too long.
         """
-        booked_items = set(get_items_booked_on_date(data.get('date')))
-        for item in data.get('items'):
-            if item and item.id in booked_items:
-                raise ValidationError('Items contains a previously booked item')
+        days = (data['end_date'] - data['start_date']).days + 1
+        if days < 1:
+            raise ValidationError('From should not be after to.')
+        max_days = app.config['MATERIAAL_AVAILABILITY_MAX_DAYS']
+        if days > max_days:
+            raise ValidationError(
+                'The range should be at most {} days.'.format(max_days)
+            )
 
 
 class MaterialTypeSchema(ma.Schema):
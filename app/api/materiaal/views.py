@@ -8,11 +8,18 @@ from flask_restful import Resource
 from app import db
 from app import emails
 from app.api import api
+from app.api.sync import SyncSchema, make_etag, not_modified, sync_response
+from app.response_cache import cached_response
 from app.models import MaterialReservation, MaterialType
-from .schema import ReservationSchema, ReserveSchema, MaterialTypeSchema
+from .queries import get_availability_between
+from .schema import (
+    ReservationSchema, ReserveSchema, AvailabilitySchema, MaterialTypeSchema
+)
 
 reservations_schema = ReservationSchema(many=True)
+sync_schema = SyncSchema()
 reserve_schema = ReserveSchema()
+availability_schema = AvailabilitySchema()
 material_types_schema = MaterialTypeSchema(many=True)
 
 
@@ -21,15 +28,42 @@ class MaterialReservationListResource(Resource):
 
     @jwt.jwt_required()
     def get(self):
-        yesterday = datetime.date.today() - datetime.timedelta(1)
-        reservations = MaterialReservation.get_all_after(yesterday)
+        try:
+            params = sync_schema.load(request.args)
+        except ma.ValidationError as err:
+            return {'msg': '400 Bad Request', 'errors': err.messages}, 400
 
         user = jwt.current_user
+        start_date = params.get('start_date')
+        end_date = params.get('end_date')
+        since = params.get('updated_since')
+
+        # An unchanged listing is answered with a single query
+        version, last_modified = MaterialReservation.sync_state()
+        etag = make_etag('materiaal', user.id, start_date, end_date, since, version)
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+
+        reservations = MaterialReservation.get_all_after(
+            start_date - datetime.timedelta(1),
+            eager=True,
+            end_date=end_date,
+            since=since
+        )
+        deleted = [r.id for r in reservations if r.is_deleted]
+        reservations = [r for r in reservations if not r.is_deleted]
         for reservation in reservations:
-            reservation.own = user.id == reservation.user.id
+            reservation.own = user.id == reservation.user_id
 
         data = reservations_schema.dump(reservations)
-        return {'success': True, 'reservations': data}
+        return sync_response({
+            'success': True,
+            'reservations': data,
+            'deleted': deleted,
+            # The cursor for the next updated_since
+            'updated_since': version or 0
+        }, etag, last_modified)
 
     @jwt.jwt_required()
     def post(self):
@@ -61,10 +95,11 @@ class MaterialReservationResource(Resource):
     def delete(self, reservation_id):
         user = jwt.current_user
         reservation = MaterialReservation.query.get(reservation_id)
-        if not reservation or reservation.user.id != user.id:
+        if not reservation or reservation.is_deleted or reservation.user.id != user.id:
             return {'msg': '400 Bad Request'}, 400
 
-        db.session.delete(reservation)
+        # The tombstone tells syncing clients about the deletion
+        reservation.soft_delete()
         db.session.commit()
         return {'success': True}
 
@@ -73,7 +108,25 @@ class MaterialReservationResource(Resource):
 class MaterialTypeResource(Resource):
 
     @jwt.jwt_required()
+    @cached_response('materiaal.types', models=[MaterialType])
     def get(self):
         types = MaterialType.query.all()
         data = material_types_schema.dump(types)
         return {'success': True, 'items': data}
+
+
+@api.resource('/materiaal/availability')
+class MaterialAvailabilityResource(Resource):
+
+    @jwt.jwt_required()
+    def get(self):
+        try:
+            data = availability_schema.load(request.args)
+        except ma.ValidationError as err:
+            return {'msg': '400 Bad Request', 'errors': err.messages}, 400
+
+        items, availability = get_availability_between(
+            data.get('start_date'),
+            data.get('end_date')
+        )
+        return {'success': True, 'items': items, 'availability': availability}
@@ -0,0 +1,76 @@
+import datetime
+import hashlib
+
+from flask import Response, request
+from marshmallow import fields, ValidationError, validates_schema, post_load
+from marshmallow.validate import Range
+from werkzeug.http import is_resource_modified
+
+from app import ma
+from app.api import api
+
+
+class SyncSchema(ma.Schema):
+    start_date = fields.Date(data_key='from')
+    end_date = fields.Date(data_key='to')
+    # The sync version of the previous response
+    updated_since = fields.Integer(validate=Range(min=0))
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        """
+        Validates whether the range is not reversed.
+        """
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise ValidationError('From should not be after to.')
+
+    @post_load
+    def fill_defaults(self, data, **kwargs):
+        """
+        Defaults the start of the range to today.
+        """
+        data.setdefault('start_date', datetime.date.today())
+        return data
+
+
+def make_etag(*parts):
+    """
+    Returns an ETag for a listing determined by the given parts.
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, last_modified):
+    """
+    Returns a 304 Not Modified response if the client has an up to date copy
+    of the listing with the given ETag, or None. The last modification time
+    only has a precision of a second and is not in commit order, so a request
+    with only If-Modified-Since always gets the full listing.
+    """
+    if is_resource_modified(request.environ, etag=etag):
+        return None
+    return set_sync_headers(Response(status=304), etag, last_modified)
+
+
+def sync_response(data, etag, last_modified):
+    """
+    Returns the response of a listing with its ETag and last modification
+    time.
+    """
+    return set_sync_headers(api.make_response(data, 200), etag, last_modified)
+
+
+def set_sync_headers(response, etag, last_modified):
+    """
+    Sets the ETag and last modification time of a listing on the given
+    response. Listings contain authenticated data, which browsers should
+    revalidate before use.
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,51 @@
+import sqlalchemy as sqla
+
+from app import db
+from app.models import User
+
+
+def get_directory_key(row):
+    """
+    Returns the position of the given user directory row in the directory
+    ordering, which is used as pagination cursor.
+    """
+    return [row.corridor or '', row.room or '', row.id]
+
+
+def get_directory_page(limit, cursor=None, corridor=None, name=None):
+    """
+    Returns at most the given number of user directory rows, ordered by
+    corridor, room and id and starting after the given cursor (see
+    get_directory_key), together with whether more rows follow. The rows
+    only contain the public columns and the contact details of users who do
+    not share them are left out by the query.
+    """
+    corridor_key = sqla.func.coalesce(User.corridor, '')
+    room_key = sqla.func.coalesce(User.room, '')
+
+    query = db.session.query(
+        User.id,
+        User.first_name,
+        User.last_name,
+        sqla.case((User.is_sharing, User.email), else_=None).label('email'),
+        sqla.case((User.is_sharing, User.phone), else_=None).label('phone'),
+        User.corridor,
+        User.room
+    )
+    if cursor is not None:
+        query = query.filter(
+            sqla.tuple_(corridor_key, room_key, User.id) > tuple(cursor)
+        )
+    if corridor is not None:
+        query = query.filter(User.corridor == corridor)
+    if name is not None:
+        prefix = name.lower()
+        query = query.filter(sqla.or_(
+            sqla.func.lower(User.first_name).startswith(prefix, autoescape=True),
+            sqla.func.lower(User.last_name).startswith(prefix, autoescape=True)
+        ))
+
+    rows = query.order_by(corridor_key, room_key, User.id) \
+                .limit(limit + 1) \
+                .all()
+    return rows[:limit], len(rows) > limit
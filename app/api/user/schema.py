@@ -1,7 +1,38 @@
-from marshmallow import fields
-from marshmallow.validate import Length
+import base64
+import binascii
+import json
 
-from app import ma
+from marshmallow import fields, ValidationError
+from marshmallow.validate import Length, Range
+
+from app import app, ma
+
+
+def dump_cursor(key):
+    """
+    Returns the opaque pagination cursor of the given directory key.
+    """
+    data = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def load_cursor(cursor):
+    """
+    Returns the directory key of the given pagination cursor.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        corridor, room, user_id = json.loads(data)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValidationError('Invalid cursor.')
+    if not (isinstance(corridor, str) and isinstance(room, str)
+            and isinstance(user_id, int)):
+        raise ValidationError('Invalid cursor.')
+    return corridor, room, user_id
+
+
+def validate_limit(limit):
+    Range(1, app.config['USER_DIRECTORY_PAGE_SIZE'])(limit)
 
 
 class UserSchema(ma.Schema):
@@ -29,7 +60,14 @@ class PublicUserSchema(ma.Schema):
     id = fields.Integer()
     first_name = fields.String()
     last_name = fields.String()
-    email = fields.Function(lambda user: user.email if user.is_sharing else None)
-    phone = fields.Function(lambda user: user.phone if user.is_sharing else None)
+    email = fields.String()
+    phone = fields.String()
     corridor = fields.String()
     room = fields.String()
+
+
+class DirectorySchema(ma.Schema):
+    limit = fields.Integer(validate=validate_limit)
+    cursor = fields.Function(deserialize=load_cursor)
+    corridor = fields.String()
+    name = fields.String(validate=Length(1))
@@ -4,15 +4,20 @@ import flask_jwt_extended as jwt
 from flask import request
 from flask_restful import Resource
 
-from app import db
+from app import app, db
 from app.api import api
-from app.models import User
-from .schema import UserSchema, EditSchema, EditSecureSchema, PublicUserSchema
+from app.identity import invalidate_user
+from .queries import get_directory_key, get_directory_page
+from .schema import (
+    UserSchema, EditSchema, EditSecureSchema, PublicUserSchema, DirectorySchema,
+    dump_cursor
+)
 
 user_schema = UserSchema()
 edit_schema = EditSchema()
 edit_secure_schema = EditSecureSchema()
 public_users_schema = PublicUserSchema(many=True)
+directory_schema = DirectorySchema()
 
 
 @api.resource('/user/profile')
@@ -43,6 +48,7 @@ class UserEditResource(Resource):
 
         db.session.add(user)
         db.session.commit()
+        invalidate_user(user)
         return {'success': True}
 
 
@@ -70,6 +76,7 @@ class UserEditSecureResource(Resource):
 
         db.session.add(user)
         db.session.commit()
+        invalidate_user(user)
         return {'success': True}
 
 
@@ -78,6 +85,22 @@ class UsersResource(Resource):
 
     @jwt.jwt_required()
     def get(self):
-        users = User.query.all()
+        try:
+            args = directory_schema.load(request.args)
+        except ma.ValidationError as err:
+            return {'msg': '400 Bad Request', 'errors': err.messages}, 400
+
+        users, has_more = get_directory_page(
+            args.get('limit', app.config['USER_DIRECTORY_PAGE_SIZE']),
+            cursor=args.get('cursor'),
+            corridor=args.get('corridor'),
+            name=args.get('name')
+        )
         data = public_users_schema.dump(users)
-        return {'success': True, 'users': data}
+        next_cursor = dump_cursor(get_directory_key(users[-1])) if has_more else None
+
+        response = api.make_response(
+            {'success': True, 'users': data, 'next': next_cursor}, 200
+        )
+        response.add_etag()
+        return response.make_conditional(request)
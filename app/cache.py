@@ -0,0 +1,213 @@
+import collections
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+
+from werkzeug.utils import import_string
+
+
+class BaseCache(object):
+
+    """
+    Represents a key-value cache with a default time to live (in seconds) and
+    hit/miss counters.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """
+        Returns the value stored under the given key, or None.
+        """
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores the given value under the given key.
+        """
+        self._set(key, value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        """
+        Removes the value stored under the given key.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes all stored values.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of this process.
+        """
+        with self._stats_lock:
+            return {'hits': self._hits, 'misses': self._misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+
+class MemoryCache(BaseCache):
+
+    """
+    Represents an in-process least recently used cache.
+    """
+
+    def __init__(self, ttl, size):
+        super(MemoryCache, self).__init__(ttl)
+        self.size = size
+        self._lock = threading.Lock()
+        self._data = collections.OrderedDict()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class FileSystemCache(BaseCache):
+
+    """
+    Represents a cache stored in a directory, shared by all worker processes
+    on the same machine.
+    """
+
+    def __init__(self, ttl, directory):
+        super(FileSystemCache, self).__init__(ttl)
+        self.directory = directory
+        # The cached values are unpickled, so nobody else may write them
+        check_private_directory(os.path.dirname(directory), mode_mask=0o022)
+        check_private_directory(directory, mode_mask=0o077)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def _get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def _set(self, key, value, ttl):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + ttl, value), f)
+        os.replace(tmp_path, path)
+
+
+def check_private_directory(directory, mode_mask):
+    """
+    Creates the given directory (only accessible by the current user) if it
+    does not exist. Raises a RuntimeError if it is a symbolic link, is owned
+    by another user or has any of the permission bits of the given mask.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError('Cache directory {} is not a directory'.format(directory))
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise RuntimeError(
+            'Cache directory {} is owned by another user'.format(directory)
+        )
+    if info.st_mode & mode_mask:
+        raise RuntimeError(
+            'Cache directory {} is accessible by other users (mode {:o})'
+            .format(directory, stat.S_IMODE(info.st_mode))
+        )
+
+
+_caches = {}
+
+
+def create_cache(app, namespace, ttl, size):
+    """
+    Returns a cache for the given namespace using the backend configured by
+    CACHE_TYPE: 'memory', 'filesystem' (in CACHE_DIR) or the import path of
+    a BaseCache subclass accepting the application, namespace, ttl and size.
+    """
+    cache_type = app.config['CACHE_TYPE']
+    if cache_type == 'memory':
+        cache = MemoryCache(ttl, size)
+    elif cache_type == 'filesystem':
+        directory = app.config['CACHE_DIR']
+        if not directory:
+            raise RuntimeError('CACHE_DIR is required by the filesystem cache')
+        cache = FileSystemCache(ttl, os.path.join(os.path.abspath(directory), namespace))
+    else:
+        cache = import_string(cache_type)(app, namespace, ttl, size)
+    _caches[namespace] = cache
+    return cache
+
+
+def cache_stats():
+    """
+    Returns the hit and miss counters of this process by cache namespace.
+    """
+    return dict(
+        (namespace, cache.stats())
+        for namespace, cache in sorted(_caches.items())
+    )
@@ -0,0 +1,303 @@
+import datetime
+import json
+import re
+from types import SimpleNamespace
+
+import click
+import sqlalchemy as sqla
+from flask.cli import AppGroup
+
+from app import app, db
+from app.api.bread import queries as bread_queries
+from app.api.materiaal import queries as materiaal_queries
+from app.models import (
+    BreadOrderCount, KotbarReservation, MaterialReservation, seed_sync_versions
+)
+from app.token.exports import bread_report_csv
+
+database_cli = AppGroup('database', help='Manage the database schema.')
+bread_cli = AppGroup('bread', help='Report on the bread orders.')
+
+# Indexes replaced by another index, by table
+OBSOLETE_INDEXES = {
+    # Replaced by a unique index on the reservations which are not deleted
+    'kotbar_reservation': ['ix_kotbar_reservation_date'],
+}
+
+# Small catalog tables which may be scanned as a whole
+CATALOG_TABLES = {'bread_type', 'material_type', 'group'}
+
+
+def hot_queries():
+    """
+    Returns the queries on the hot paths, which should be answered using
+    indexes, as (name, function) pairs.
+    """
+    today = datetime.date.today()
+    nobody = SimpleNamespace(id=0)
+    return [
+        ('kotbar reservations',
+         lambda: KotbarReservation.get_all_after(today, eager=True)),
+        ('kotbar overview',
+         lambda: KotbarReservation.get_all_after(today, eager=True, ascending=True)),
+        ('kotbar booked',
+         lambda: KotbarReservation.is_booked(today)),
+        ('kotbar sync state',
+         lambda: KotbarReservation.sync_state()),
+        ('material sync state',
+         lambda: MaterialReservation.sync_state()),
+        ('material reservations',
+         lambda: MaterialReservation.get_all_after(today, eager=True)),
+        ('material booked',
+         lambda: materiaal_queries.get_items_booked_on_date(today)),
+        ('bread overview',
+         lambda: bread_queries.get_order_dates_extended(nobody, today)),
+        ('bread week totals',
+         lambda: list(bread_queries.get_week_order_totals(nobody))),
+        ('bread week orders',
+         lambda: list(bread_queries.get_week_order_detailed(nobody))),
+    ]
+
+
+def upgrade_schema():
+    """
+    Brings an existing database up to date with the models by creating the
+    missing tables, columns, triggers, sync versions and indexes and dropping
+    the obsolete indexes. New order count tables are filled from the existing
+    orders. Can be run repeatedly. Returns a description of every change.
+    """
+    has_counts = sqla.inspect(db.engine).has_table(BreadOrderCount.__tablename__)
+    db.create_all()
+    if not has_counts:
+        bread_queries.rebuild_order_counts()
+
+    changes = []
+    inspector = sqla.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                add_column(column)
+                changes.append('Added column {}.{}'.format(table.name, column.name))
+
+    with db.engine.begin() as connection:
+        seed_sync_versions(connection)
+
+    inspector = sqla.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique:
+                check_duplicates(index)
+            index.create(bind=db.engine)
+            changes.append('Created index {}'.format(index.name))
+        for name in OBSOLETE_INDEXES.get(table.name, ()):
+            if name in existing:
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql(
+                        'DROP INDEX ' + connection.dialect.identifier_preparer.quote(name)
+                    )
+                changes.append('Dropped index {}'.format(name))
+    return changes
+
+
+def add_column(column):
+    """
+    Adds the given column to its existing table. Existing rows get the
+    default of the column. The column is nullable on SQLite, which cannot add
+    a required column without a constant default.
+    """
+    with db.engine.begin() as connection:
+        preparer = connection.dialect.identifier_preparer
+        table = preparer.format_table(column.table)
+        name = preparer.quote(column.name)
+        connection.exec_driver_sql('ALTER TABLE {} ADD COLUMN {} {}'.format(
+            table, name, column.type.compile(dialect=connection.dialect)
+        ))
+        if column.default is not None:
+            value = column.default.arg
+            if column.default.is_callable:
+                value = value(None)
+            # Names only the new column, the update of the table would also
+            # set the columns which are updated automatically and may be
+            # missing as well
+            table_clause = sqla.table(column.table.name, sqla.column(column.name))
+            connection.execute(sqla.update(table_clause).values({column.name: value}))
+        if not column.nullable and connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(
+                'ALTER TABLE {} ALTER COLUMN {} SET NOT NULL'.format(table, name)
+            )
+
+
+def check_duplicates(index):
+    """
+    Raises a ClickException if the rows of the table violate the given unique
+    index.
+    """
+    columns = list(index.columns)
+    query = sqla.select(*columns, sqla.func.count()) \
+                .group_by(*columns) \
+                .having(sqla.func.count() > 1)
+    duplicates = db.session.execute(query).all()
+    if duplicates:
+        raise click.ClickException(
+            'Cannot create unique index {}, resolve the duplicate rows '
+            'first: {}'.format(index.name, [tuple(row) for row in duplicates])
+        )
+
+
+def explain(connection, statement, parameters):
+    """
+    Returns the query plan of the given statement as a list of lines.
+    """
+    if connection.dialect.name == 'postgresql':
+        result = connection.exec_driver_sql('EXPLAIN ' + statement, parameters)
+        return [row[0] for row in result]
+    result = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return [row[-1] for row in result]
+
+
+def find_scans(dialect, plan):
+    """
+    Returns the tables which are scanned sequentially according to the given
+    query plan.
+    """
+    if dialect == 'postgresql':
+        pattern = re.compile(r'Seq Scan on "?(\w+)"?')
+    else:
+        pattern = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?')
+    scans = []
+    for line in plan:
+        if line.strip() == 'SCAN CONSTANT ROW':
+            continue
+        match = pattern.search(line.strip())
+        if match and match.group(1) not in CATALOG_TABLES:
+            scans.append(match.group(1))
+    return scans
+
+
+def check_query_plans():
+    """
+    Runs the hot queries and returns for each executed statement its name,
+    the statement, its query plan and the sequentially scanned tables.
+    """
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    results = []
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        # Tiny test tables are always scanned unless scans are discouraged
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+
+    for name, run in hot_queries():
+        del executed[:]
+        sqla.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            run()
+        finally:
+            sqla.event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        for statement, parameters in executed:
+            plan = explain(connection, statement, parameters)
+            results.append({
+                'name': name,
+                'statement': statement,
+                'plan': plan,
+                'scans': find_scans(dialect, plan),
+            })
+    db.session.rollback()
+    return results
+
+
+@database_cli.command('upgrade')
+def upgrade():
+    """
+    Creates the missing tables, columns and indexes.
+    """
+    for change in upgrade_schema():
+        click.echo(change)
+    click.echo('Database is up to date')
+
+
+@database_cli.command('check-plans')
+def check_plans():
+    """
+    Fails if a hot query is answered with a sequential scan.
+    """
+    failed = False
+    for result in check_query_plans():
+        click.echo('{}: {}'.format(result['name'], ' '.join(result['statement'].split())))
+        for line in result['plan']:
+            click.echo('    ' + line)
+        if result['scans']:
+            failed = True
+            click.echo('    -> sequential scan on {}'.format(', '.join(result['scans'])))
+    if failed:
+        raise click.ClickException('A hot query uses a sequential scan')
+
+
+@bread_cli.command('report')
+@click.option('--from', 'start_date', type=click.DateTime(['%Y-%m-%d']),
+              help='First day of the report (default: start of the semester).')
+@click.option('--to', 'end_date', type=click.DateTime(['%Y-%m-%d']),
+              help='Last day of the report (default: end of the semester).')
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'json']),
+              default='csv', show_default=True)
+def bread_report(start_date, end_date, output_format):
+    """
+    Prints the number of orders and the revenue per bread type for every
+    order date in a range.
+    """
+    if start_date:
+        start_date = start_date.date()
+    else:
+        start_date, _ = bread_queries.get_semester(datetime.date.today())
+    if end_date:
+        end_date = end_date.date()
+    else:
+        _, end_date = bread_queries.get_semester(start_date)
+    if end_date < start_date:
+        raise click.BadParameter('should not be before --from', param_hint='--to')
+
+    report = bread_queries.get_order_report(start_date, end_date)
+    if output_format == 'json':
+        click.echo(json.dumps(report, indent=2))
+    else:
+        for line in bread_report_csv(report):
+            click.echo(line, nl=False)
+
+
+@bread_cli.command('rebuild-counts')
+def rebuild_counts():
+    """
+    Recomputes the maintained order counts from the orders.
+    """
+    counted = bread_queries.rebuild_order_counts()
+    click.echo('Counted orders of {} dates and types'.format(counted))
+
+
+@bread_cli.command('verify-counts')
+def verify_counts():
+    """
+    Fails if the maintained order counts differ from the orders.
+    """
+    drift = bread_queries.find_order_count_drift()
+    for date_id, type_id, stored, actual in drift:
+        click.echo('date {} type {}: counted {}, actual {}'.format(
+            date_id, type_id, stored, actual
+        ))
+    if drift:
+        raise click.ClickException(
+            'The order counts drifted, run `flask bread rebuild-counts`'
+        )
+    click.echo('The order counts are up to date')
+
+
+app.cli.add_command(database_cli)
+app.cli.add_command(bread_cli)
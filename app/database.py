@@ -0,0 +1,115 @@
+import threading
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+_stats_lock = threading.Lock()
+_stats = {
+    'checkouts': 0,
+    'waits': 0,
+    'timeouts': 0,
+    'wait_seconds_total': 0.0,
+    'wait_seconds_max': 0.0,
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    """
+    Represents a queue pool which records how long checkouts wait for a
+    connection. Checkouts which were served within a millisecond are not
+    counted as waits.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with _stats_lock:
+                _stats['timeouts'] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with _stats_lock:
+                _stats['checkouts'] += 1
+                if waited >= 0.001:
+                    _stats['waits'] += 1
+                    _stats['wait_seconds_total'] += waited
+                    _stats['wait_seconds_max'] = max(_stats['wait_seconds_max'], waited)
+
+
+def engine_options(config, sa_url):
+    """
+    Returns the engine options for the given database url built from the
+    DATABASE_* configuration. The pool is sized for the threads of a worker
+    process. In memory SQLite databases keep their single connection.
+    """
+    dialect = sa_url.get_backend_name()
+    if dialect == 'sqlite' and sa_url.database in (None, '', ':memory:'):
+        return {}
+
+    pool_size = config['DATABASE_POOL_SIZE'] or config['WSGI_THREADS']
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+    }
+
+    connect_args = {}
+    if dialect == 'postgresql':
+        connect_args['connect_timeout'] = config['DATABASE_CONNECT_TIMEOUT']
+        if config['DATABASE_STATEMENT_TIMEOUT']:
+            connect_args['options'] = '-c statement_timeout={:d}'.format(
+                int(config['DATABASE_STATEMENT_TIMEOUT'] * 1000)
+            )
+        if sa_url.get_driver_name() == 'psycopg2':
+            # Detect connections dropped by a restart or a firewall
+            connect_args['keepalives'] = 1
+            connect_args['keepalives_idle'] = config['DATABASE_KEEPALIVES_IDLE']
+            connect_args['keepalives_interval'] = config['DATABASE_KEEPALIVES_INTERVAL']
+            connect_args['keepalives_count'] = config['DATABASE_KEEPALIVES_COUNT']
+    elif dialect == 'sqlite':
+        # Pooled connections are used by other threads than their creator
+        connect_args['check_same_thread'] = False
+        if config['DATABASE_STATEMENT_TIMEOUT']:
+            # SQLite only waits this long for a lock held by another writer
+            connect_args['timeout'] = config['DATABASE_STATEMENT_TIMEOUT']
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+class Database(SQLAlchemy):
+
+    """
+    Represents the Flask-SQLAlchemy extension with engine options built from
+    the DATABASE_* configuration. SQLALCHEMY_ENGINE_OPTIONS still take
+    precedence.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        for key, value in engine_options(app.config, sa_url).items():
+            options.setdefault(key, value)
+        return super(Database, self).apply_driver_hacks(app, sa_url, options)
+
+
+def pool_stats(engine):
+    """
+    Returns the size, checked out and overflow connections of the pool of the
+    given engine (if it has a queue pool) and the checkout wait statistics of
+    this process.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        stats['size'] = pool.size()
+        stats['checked_out'] = pool.checkedout()
+        stats['overflow'] = max(0, pool.overflow())
+    return stats
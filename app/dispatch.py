@@ -0,0 +1,313 @@
+import atexit
+import collections
+import os
+import queue
+import smtplib
+import threading
+import time
+
+
+class ConnectionPool(object):
+
+    """
+    Keeps a number of authenticated SMTP connections alive, so consecutive
+    emails do not each pay for the TCP, TLS and authentication handshakes.
+    Idle connections are closed after a timeout and checked with a NOOP before
+    reuse once they have been idle for a while.
+    """
+
+    def __init__(self, mail, size, idle_timeout, check_interval):
+        self.mail = mail
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._idle = collections.deque()
+        self._pid = os.getpid()
+
+    def acquire(self):
+        """
+        Returns a healthy idle connection or opens a new one.
+        """
+        while True:
+            with self._lock:
+                self._check_pid()
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            idle = time.monotonic() - last_used
+            if idle > self.idle_timeout:
+                self._close(connection)
+            elif idle > self.check_interval and not self._is_healthy(connection):
+                self._close(connection)
+            else:
+                return connection
+        return self.mail.connect().__enter__()
+
+    def release(self, connection):
+        """
+        Returns the given connection to the pool, closing it if the pool is
+        full.
+        """
+        with self._lock:
+            self._check_pid()
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    def discard(self, connection):
+        """
+        Closes the given (broken) connection without returning it to the pool.
+        """
+        if connection is not None:
+            self._close(connection)
+
+    def prune(self):
+        """
+        Closes all connections which have been idle for too long.
+        """
+        expired = []
+        with self._lock:
+            now = time.monotonic()
+            while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+        for connection in expired:
+            self._close(connection)
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def stats(self):
+        """
+        Returns the number of idle connections.
+        """
+        with self._lock:
+            return {'idle': len(self._idle)}
+
+    def _check_pid(self):
+        # Connections inherited from a parent process are not ours to use
+        if self._pid != os.getpid():
+            self._idle = collections.deque()
+            self._pid = os.getpid()
+
+    @staticmethod
+    def _is_healthy(connection):
+        if connection.host is None:
+            return True
+        try:
+            return connection.host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+
+
+class Mailer(object):
+
+    """
+    Dispatches outbound emails in the background. Messages are put on a bounded
+    in-process queue which is drained by a pool of worker threads. Pending
+    messages are sent in batches over pooled SMTP connections.
+    """
+
+    def __init__(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.queue = queue.Queue(maxsize=app.config['MAIL_QUEUE_SIZE'])
+        self.pool = ConnectionPool(
+            mail,
+            size=app.config['MAIL_POOL_SIZE'],
+            idle_timeout=app.config['MAIL_POOL_IDLE_TIMEOUT'],
+            check_interval=app.config['MAIL_POOL_CHECK_INTERVAL']
+        )
+
+        self._lock = threading.Lock()
+        self._workers = []
+        self._pid = None
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'inline': 0,
+            'send_seconds_total': 0.0,
+            'send_seconds_max': 0.0,
+        }
+
+        atexit.register(self.close, app.config['MAIL_SHUTDOWN_TIMEOUT'])
+
+    def send(self, msg):
+        """
+        Queues the given message for delivery. If no workers are configured or
+        the queue stays full, the message is delivered within the caller.
+        """
+        if self.app.config['MAIL_WORKERS'] <= 0:
+            self._deliver_inline(msg)
+            return
+
+        self._ensure_workers()
+        try:
+            self.queue.put(msg, timeout=self.app.config['MAIL_QUEUE_TIMEOUT'])
+        except queue.Full:
+            self.app.logger.warning('Mail queue is full, sending inline')
+            self._deliver_inline(msg)
+            return
+        self._count('enqueued')
+
+    def flush(self, timeout=None):
+        """
+        Blocks until all queued messages have been handled or the timeout (in
+        seconds) expires. Returns whether the queue was drained.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                if deadline is None:
+                    self.queue.all_tasks_done.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """
+        Flushes the queue and closes all pooled connections. Returns whether
+        the queue was drained.
+        """
+        drained = self.flush(timeout)
+        self.pool.close()
+        return drained
+
+    def stats(self):
+        """
+        Returns a snapshot of the queue depth and delivery counters.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['workers'] = len(self._workers)
+        stats['pool_idle'] = self.pool.stats()['idle']
+        return stats
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _record_send(self, seconds):
+        with self._stats_lock:
+            self._stats['sent'] += 1
+            self._stats['send_seconds_total'] += seconds
+            if seconds > self._stats['send_seconds_max']:
+                self._stats['send_seconds_max'] = seconds
+
+    def _ensure_workers(self):
+        """
+        Starts the worker threads, also in a freshly forked process.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._workers = []
+            for i in range(self.app.config['MAIL_WORKERS']):
+                worker = threading.Thread(
+                    target=self._work,
+                    name='mailer-{}'.format(i),
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+            self._pid = os.getpid()
+
+    def _deliver_inline(self, msg):
+        with self.app.app_context():
+            self._count('inline')
+            self._deliver([msg])
+
+    def _work(self):
+        batch_size = self.app.config['MAIL_BATCH_SIZE']
+        with self.app.app_context():
+            while True:
+                try:
+                    msg = self.queue.get(timeout=self.pool.idle_timeout)
+                except queue.Empty:
+                    self.pool.prune()
+                    continue
+
+                batch = [msg]
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                try:
+                    self._deliver(batch)
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+
+    def _deliver(self, batch):
+        """
+        Sends the given messages over a single pooled connection.
+        """
+        connection = None
+        try:
+            for msg in batch:
+                connection = self._send(msg, connection)
+        finally:
+            if connection is not None:
+                self.pool.release(connection)
+
+    def _send(self, msg, connection):
+        """
+        Sends the message over the given connection, reconnecting and retrying
+        with exponential backoff on failure. Returns the connection which can
+        be reused for the next message.
+        """
+        retries = self.app.config['MAIL_MAX_RETRIES']
+        backoff = self.app.config['MAIL_RETRY_BACKOFF']
+        for attempt in range(retries + 1):
+            try:
+                if connection is None:
+                    connection = self.pool.acquire()
+                start = time.perf_counter()
+                connection.send(msg)
+                self._record_send(time.perf_counter() - start)
+                return connection
+            except (smtplib.SMTPException, OSError):
+                self.pool.discard(connection)
+                connection = None
+                if attempt == retries:
+                    self._count('failed')
+                    self.app.logger.exception(
+                        'Failed to send email "%s"', msg.subject
+                    )
+                    return None
+                self._count('retried')
+                time.sleep(backoff * 2 ** attempt)
+            except Exception:
+                # The message itself is invalid, retrying will not help
+                self._count('failed')
+                self.app.logger.exception(
+                    'Failed to send email "%s"', msg.subject
+                )
+                return connection
@@ -1,25 +1,23 @@
-import asyncio
+from flask import url_for
 
-from flask import render_template, url_for
-from flask_mail import Message
-
-from app import app, mail
+from app import app, mailer
+from app.messages import EmailTemplate, MimeAttachment, PreparedMessage
 from app.security import dump_token
 
-# load assets in memory to speedup sending emails
+# load assets in memory and encode them once to speedup sending emails
 with app.open_resource('assets/kotbar_rules.pdf') as f:
-    KOTBAR_RULES = f.read()
+    KOTBAR_RULES = MimeAttachment('kotbar_rules.pdf', 'application/pdf', f.read())
 
 with app.open_resource('assets/materiaal_rules.pdf') as f:
-    MATERIAAL_RULES = f.read()
-
+    MATERIAAL_RULES = MimeAttachment('materiaal_rules.pdf', 'application/pdf', f.read())
 
-async def send_async_email(msg):
-    """
-    Sends an email asynchronously.
-    """
-    with app.app_context():
-        mail.send(msg)
+# compile templates once to speedup rendering emails
+ACTIVATION = EmailTemplate(app.jinja_env, 'activation')
+RESET = EmailTemplate(app.jinja_env, 'reset')
+KOTBAR_RESERVATION = EmailTemplate(app.jinja_env, 'kotbar_reservation')
+KOTBAR_RESERVATION_ADMIN = EmailTemplate(app.jinja_env, 'kotbar_reservation_admin')
+MATERIAAL_RESERVATION = EmailTemplate(app.jinja_env, 'materiaal_reservation')
+MATERIAAL_RESERVATION_ADMIN = EmailTemplate(app.jinja_env, 'materiaal_reservation_admin')
 
 
 def send_activation(user):
@@ -31,16 +29,10 @@ def send_activation(user):
         'token.activate', token=token, _external=True
     )
 
-    msg = Message()
+    msg = PreparedMessage(ACTIVATION, user=user, secret_url=secret_url)
     msg.subject = 'Lerkeveld Underground - Activeer Account'
     msg.add_recipient(user.email)
-    msg.body = render_template(
-        'emails/activation.txt', user=user, secret_url=secret_url
-    )
-    msg.html = render_template(
-        'emails/activation.html', user=user, secret_url=secret_url
-    )
-    asyncio.run(send_async_email(msg))
+    mailer.send(msg)
 
 
 def send_reset(user):
@@ -52,86 +44,59 @@ def send_reset(user):
         'token.reset', token=token, _external=True
     )
 
-    msg = Message()
+    msg = PreparedMessage(RESET, user=user, secret_url=secret_url)
     msg.subject = 'Lerkeveld Underground - Reset Wachtwoord'
     msg.add_recipient(user.email)
-    msg.body = render_template(
-        'emails/reset.txt', user=user, secret_url=secret_url
-    )
-    msg.html = render_template(
-        'emails/reset.html', user=user, secret_url=secret_url
-    )
-    asyncio.run(send_async_email(msg))
+    mailer.send(msg)
 
 
-def send_kotbar_reservation(reservation):
+def prepare_kotbar_reservation(reservation):
     """
-    Sends an email to notify the user of a successful reservation of the kotbar.
+    Returns the email which notifies the user of a successful reservation of
+    the kotbar. The email is rendered immediately.
     """
-    msg = Message()
+    msg = PreparedMessage(
+        KOTBAR_RESERVATION,
+        parts=[KOTBAR_RULES],
+        reservation=reservation
+    )
     msg.subject = 'Lerkeveld Underground - Bevestiging Reservatie'
     msg.add_recipient(reservation.user.email)
-    msg.body = render_template(
-        'emails/kotbar_reservation.txt', reservation=reservation
-    )
-    msg.html = render_template(
-        'emails/kotbar_reservation.html', reservation=reservation
-    )
-    msg.attach(
-        'kotbar_rules.pdf',
-        'application/pdf',
-        KOTBAR_RULES,
-        'attachment; filename="kotbar_rules.pdf"'
-    )
-    asyncio.run(send_async_email(msg))
+    return msg
 
 
-def send_kotbar_reservation_admin(reservation):
+def prepare_kotbar_reservation_admin(reservation):
     """
-    Sends an email to notify the kotbar mailinglist of a new successful
-    reservation.
+    Returns the email which notifies the kotbar mailinglist of a new
+    successful reservation. The email is rendered immediately.
     """
     token = app.config.get('TOKEN_KOTBAR_RESERVATIONS', None)
     secret_url = url_for(
         'token.kotbar_reservations', token=token, _external=True
     )
 
-    msg = Message()
-    msg.subject = 'Lerkeveld Underground - Reservatie Kotbar'
-    msg.recipients = app.config.get('MAIL_KOTBAR_ADMIN', [])
-    msg.body = render_template(
-        'emails/kotbar_reservation_admin.txt',
-        reservation=reservation,
-        secret_url=secret_url
-    )
-    msg.html = render_template(
-        'emails/kotbar_reservation_admin.html',
+    msg = PreparedMessage(
+        KOTBAR_RESERVATION_ADMIN,
         reservation=reservation,
         secret_url=secret_url
     )
-    asyncio.run(send_async_email(msg))
+    msg.subject = 'Lerkeveld Underground - Reservatie Kotbar'
+    msg.recipients = app.config.get('MAIL_KOTBAR_ADMIN', [])
+    return msg
 
 
 def send_materiaal_reservation(reservation):
     """
     Sends an email to notify the user of a successful reservation of material.
     """
-    msg = Message()
+    msg = PreparedMessage(
+        MATERIAAL_RESERVATION,
+        parts=[MATERIAAL_RULES],
+        reservation=reservation
+    )
     msg.subject = 'Lerkeveld Underground - Bevestiging Reservatie'
     msg.add_recipient(reservation.user.email)
-    msg.body = render_template(
-        'emails/materiaal_reservation.txt', reservation=reservation
-    )
-    msg.html = render_template(
-        'emails/materiaal_reservation.html', reservation=reservation
-    )
-    msg.attach(
-        'materiaal_rules.pdf',
-        'application/pdf',
-        MATERIAAL_RULES,
-        'attachment; filename="materiaal_rules.pdf"'
-    )
-    asyncio.run(send_async_email(msg))
+    mailer.send(msg)
 
 
 def send_materiaal_reservation_admin(reservation):
@@ -139,13 +104,10 @@ def send_materiaal_reservation_admin(reservation):
     Sends an email to notify the material mailinglist of a new successful
     reservation.
     """
-    msg = Message()
+    msg = PreparedMessage(
+        MATERIAAL_RESERVATION_ADMIN,
+        reservation=reservation
+    )
     msg.subject = 'Lerkeveld Underground - Reservatie Materiaal'
     msg.recipients = app.config.get('MAIL_MATERIAAL_ADMIN', [])
-    msg.body = render_template(
-        'emails/materiaal_reservation_admin.txt', reservation=reservation
-    )
-    msg.html = render_template(
-        'emails/materiaal_reservation_admin.html', reservation=reservation
-    )
-    asyncio.run(send_async_email(msg))
+    mailer.send(msg)
@@ -0,0 +1,50 @@
+import sqlalchemy as sqla
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import app, db
+from app.cache import create_cache
+from app.models import User
+
+identity_cache = create_cache(
+    app,
+    'identity',
+    ttl=app.config['IDENTITY_CACHE_TTL'],
+    size=app.config['IDENTITY_CACHE_SIZE']
+)
+
+# The password hash is not cached, it is loaded when it is accessed
+CACHED_COLUMNS = [
+    column.key for column in User.__table__.columns
+    if column.key != 'password_hash'
+]
+
+
+def load_user(user_id):
+    """
+    Returns the User with the given id. The user is reconstructed from the
+    identity cache when possible, without querying the database.
+    """
+    data = identity_cache.get(user_id)
+    if data is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            identity_cache.set(
+                user_id, {key: getattr(user, key) for key in CACHED_COLUMNS}
+            )
+        return user
+
+    user = User.__mapper__.class_manager.new_instance()
+    for key, value in data.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user):
+    """
+    Removes the given User from the identity cache. Should be called whenever
+    the user is modified. The id is read from the identity key, so an expired
+    user is not refreshed.
+    """
+    identity_cache.delete(sqla.inspect(user).identity[0])
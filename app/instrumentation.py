@@ -0,0 +1,177 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+import sqlalchemy as sqla
+from flask import g, has_request_context, request
+from sqlalchemy.engine import Engine
+
+from app import app
+
+# Upper bounds of the histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+DURATION_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram(object):
+
+    """
+    Represents a histogram with fixed bucket upper bounds, which also keeps
+    the count and sum of the observed values. Not thread safe on its own.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def dump(self):
+        """
+        Returns the bucket counts (by upper bound, the last one is unbounded),
+        count and sum of this histogram.
+        """
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'buckets': dict(zip(bounds, self.counts)),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class EndpointStats(object):
+
+    """
+    Represents the statement count, database time and request duration
+    histograms of a single endpoint.
+    """
+
+    def __init__(self):
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_time = Histogram(DURATION_MS_BUCKETS)
+        self.duration = Histogram(DURATION_MS_BUCKETS)
+
+    def dump(self):
+        return {
+            'requests': self.duration.count,
+            'queries': self.queries.dump(),
+            'db_time_ms': self.db_time.dump(),
+            'duration_ms': self.duration.dump(),
+        }
+
+
+_stats_lock = threading.Lock()
+_endpoint_stats = {}
+
+
+@sqla.event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Remembers the start time of the statement on its execution context, which
+    is discarded with the statement, also when it fails.
+    """
+    context.query_start_time = time.perf_counter()
+
+
+@sqla.event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Adds the statement to the counters of the current request and logs it when
+    it took longer than SQL_SLOW_QUERY_THRESHOLD.
+    """
+    elapsed = time.perf_counter() - context.query_start_time
+    endpoint = None
+    if has_request_context():
+        endpoint = request.endpoint
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_time = g.get('sql_time', 0) + elapsed
+
+    threshold = app.config['SQL_SLOW_QUERY_THRESHOLD']
+    if threshold is not None and elapsed >= threshold:
+        # The parameters are left out, they may contain personal data
+        app.logger.warning(
+            'Slow query (%.1f ms) in %s: %s',
+            elapsed * 1000, endpoint, ' '.join(statement.split())
+        )
+
+
+@app.before_request
+def start_request_timer():
+    """
+    Starts the duration and statement counters of the request.
+    """
+    g.request_start_time = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0
+
+
+@app.after_request
+def record_request(response):
+    """
+    Records the statement count, database time and duration of the request
+    in the histograms of its endpoint. Adds a Server-Timing header in debug
+    mode or when SQL_SERVER_TIMING is enabled.
+    """
+    start_time = g.get('request_start_time')
+    if start_time is None:
+        return response
+    duration = (time.perf_counter() - start_time) * 1000
+    queries = g.get('sql_queries', 0)
+    db_time = g.get('sql_time', 0) * 1000
+
+    endpoint = request.endpoint or 'unknown'
+    with _stats_lock:
+        stats = _endpoint_stats.get(endpoint)
+        if stats is None:
+            stats = _endpoint_stats[endpoint] = EndpointStats()
+        stats.queries.observe(queries)
+        stats.db_time.observe(db_time)
+        stats.duration.observe(duration)
+
+    if app.debug or app.config['SQL_SERVER_TIMING']:
+        response.headers.add(
+            'Server-Timing',
+            'db;dur={:.2f};desc="{} queries", app;dur={:.2f}'.format(
+                db_time, queries, duration
+            )
+        )
+    return response
+
+
+def dump():
+    """
+    Returns the histograms of all endpoints of this process.
+    """
+    with _stats_lock:
+        return {
+            endpoint: stats.dump()
+            for endpoint, stats in sorted(_endpoint_stats.items())
+        }
+
+
+def reset():
+    """
+    Removes the histograms of all endpoints of this process.
+    """
+    with _stats_lock:
+        _endpoint_stats.clear()
+
+
+@atexit.register
+def write_stats():
+    """
+    Writes the histograms to SQL_STATS_FILE (if configured, '{pid}' is replaced
+    by the process id) when the process exits.
+    """
+    path = app.config['SQL_STATS_FILE']
+    if path:
+        with open(path.format(pid=os.getpid()), 'w') as f:
+            json.dump(dump(), f, indent=2)
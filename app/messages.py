@@ -0,0 +1,94 @@
+import base64
+import uuid
+from email.mime.base import MIMEBase
+
+from flask_mail import Message
+
+
+class EmailTemplate(object):
+
+    """
+    Represents the plain text and html variant of an email template, compiled
+    once instead of being looked up on every render.
+    """
+
+    def __init__(self, jinja_env, name):
+        self.name = name
+        self.text = jinja_env.get_template('emails/{}.txt'.format(name))
+        self.html = jinja_env.get_template('emails/{}.html'.format(name))
+
+    def render(self, **context):
+        """
+        Returns the rendered plain text and html variant.
+        """
+        return self.text.render(**context), self.html.render(**context)
+
+
+class MimeAttachment(object):
+
+    """
+    Represents a file attachment whose base64 encoding is computed once and
+    shared by all messages it is attached to. Messages are serialized with a
+    short marker as payload, which is substituted by the encoded payload
+    afterwards.
+    """
+
+    def __init__(self, filename, content_type, data):
+        self.filename = filename
+        self.content_type = content_type
+        self.marker = 'attachment-{}'.format(uuid.uuid4().hex)
+        self._payload = base64.encodebytes(data).decode('ascii')
+        self._encoded = {}
+
+    def encoded(self, linesep):
+        """
+        Returns the encoded payload as bytes with the given line separator.
+        """
+        if linesep not in self._encoded:
+            payload = self._payload.replace('\n', linesep)
+            self._encoded[linesep] = payload.encode('ascii')
+        return self._encoded[linesep]
+
+    def part(self):
+        """
+        Returns a new MIME part with the marker as payload.
+        """
+        part = MIMEBase(*self.content_type.split('/'))
+        part.set_payload(self.marker + '\n')
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header(
+            'Content-Disposition', 'attachment', filename=self.filename
+        )
+        return part
+
+
+class PreparedMessage(Message):
+
+    """
+    Represents an email message assembled from a rendered template and cached
+    attachment parts. The message should have an html body, so it is built as
+    a multipart message.
+    """
+
+    def __init__(self, template, parts=(), **context):
+        super(PreparedMessage, self).__init__()
+        self.body, self.html = template.render(**context)
+        self.parts = parts
+
+    def _message(self):
+        msg = super(PreparedMessage, self)._message()
+        for part in self.parts:
+            msg.attach(part.part())
+        return msg
+
+    def as_string(self):
+        return self.as_bytes().decode('ascii')
+
+    def as_bytes(self):
+        msg = self._message()
+        linesep = msg.policy.linesep
+        data = msg.as_bytes()
+        for part in self.parts:
+            marker = (part.marker + linesep).encode('ascii')
+            data = data.replace(marker, part.encoded(linesep))
+        return data
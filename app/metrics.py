@@ -0,0 +1,304 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import Blueprint, Response, request, abort
+
+from app import app, db, mailer
+from app.cache import cache_stats
+from app.database import pool_stats
+from app.instrumentation import Histogram
+from app.security import check_token, password_hash_stats
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+# Only the requests of these blueprints are measured
+MEASURED_BLUEPRINTS = {'api', 'token'}
+
+# Upper bounds (in seconds) of the request duration buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Registry(object):
+
+    """
+    Represents the request counters and duration histograms of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.durations = {}
+
+    def observe(self, endpoint, method, status, duration):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.get(endpoint)
+            if histogram is None:
+                histogram = self.durations[endpoint] = Histogram(DURATION_BUCKETS)
+            histogram.observe(duration)
+
+    def snapshot(self):
+        """
+        Returns the counters and histograms of this process together with the
+        current gauges, in a JSON serializable form.
+        """
+        with self._lock:
+            requests = [list(key) + [count] for key, count in self.requests.items()]
+            durations = {
+                endpoint: [histogram.counts, histogram.count, histogram.sum]
+                for endpoint, histogram in self.durations.items()
+            }
+        return {
+            'pid': os.getpid(),
+            'requests': requests,
+            'durations': durations,
+            'counters': collect_counters(),
+            'gauges': collect_gauges(),
+        }
+
+
+registry = Registry()
+_last_write = [0]
+
+
+def collect_counters():
+    """
+    Returns the counters kept by other modules of this process, as (name,
+    labels, value) triples.
+    """
+    counters = []
+    for namespace, stats in cache_stats().items():
+        counters.append(['cache_hits', {'cache': namespace}, stats['hits']])
+        counters.append(['cache_misses', {'cache': namespace}, stats['misses']])
+    counters.append(['password_hash_rejected', {}, password_hash_stats()['rejected']])
+    return counters
+
+
+def collect_gauges():
+    """
+    Returns the current database pool, mail queue and password hashing gauges
+    of this process. Pools without a queue (e.g. SQLite in memory) only report
+    their checkout statistics.
+    """
+    gauges = {
+        'db_pool_' + name: value
+        for name, value in pool_stats(db.engine).items()
+    }
+
+    mail_stats = mailer.stats()
+    gauges['mail_queue_depth'] = mail_stats['queue_depth']
+    gauges['mail_workers'] = mail_stats['workers']
+
+    gauges['password_hash_active'] = password_hash_stats()['active']
+    return gauges
+
+
+def write_snapshot():
+    """
+    Writes the snapshot of this process to METRICS_DIR, so other processes can
+    aggregate it.
+    """
+    directory = app.config['METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp_path, os.path.join(directory, '{}.json'.format(os.getpid())))
+    _last_write[0] = time.monotonic()
+
+
+def read_snapshots():
+    """
+    Returns the snapshots of all processes. The gauges of processes which are
+    no longer running are left out, their counters are kept.
+    """
+    directory = app.config['METRICS_DIR']
+    if not directory:
+        return [registry.snapshot()]
+
+    write_snapshot()
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.startswith('.') or not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not is_running(snapshot['pid']):
+            snapshot['gauges'] = {}
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(snapshots):
+    """
+    Returns the aggregated snapshots in the Prometheus text format.
+    """
+    requests = {}
+    durations = {}
+    for snapshot in snapshots:
+        for endpoint, method, status, count in snapshot['requests']:
+            key = (endpoint, method, status)
+            requests[key] = requests.get(key, 0) + count
+        for endpoint, (counts, count, total) in snapshot['durations'].items():
+            aggregate = durations.setdefault(
+                endpoint, [[0] * (len(DURATION_BUCKETS) + 1), 0, 0]
+            )
+            aggregate[0] = [a + b for a, b in zip(aggregate[0], counts)]
+            aggregate[1] += count
+            aggregate[2] += total
+
+    lines = [
+        '# HELP lerkeveld_http_requests_total Number of handled requests.',
+        '# TYPE lerkeveld_http_requests_total counter',
+    ]
+    for (endpoint, method, status), count in sorted(requests.items()):
+        lines.append(
+            'lerkeveld_http_requests_total{{endpoint="{}",method="{}",status="{}"}} {}'
+            .format(escape(endpoint), method, status, count)
+        )
+
+    lines += [
+        '# HELP lerkeveld_http_request_duration_seconds Request duration.',
+        '# TYPE lerkeveld_http_request_duration_seconds histogram',
+    ]
+    for endpoint, (counts, count, total) in sorted(durations.items()):
+        label = escape(endpoint)
+        cumulative = 0
+        for bound, bucket_count in zip(DURATION_BUCKETS + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(
+                'lerkeveld_http_request_duration_seconds_bucket'
+                '{{endpoint="{}",le="{}"}} {}'.format(label, bound, cumulative)
+            )
+        lines.append(
+            'lerkeveld_http_request_duration_seconds_sum{{endpoint="{}"}} {}'
+            .format(label, total)
+        )
+        lines.append(
+            'lerkeveld_http_request_duration_seconds_count{{endpoint="{}"}} {}'
+            .format(label, count)
+        )
+
+    counters = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', ()):
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+    current = None
+    for (name, labels), value in sorted(counters.items()):
+        if name != current:
+            current = name
+            lines.append('# TYPE lerkeveld_{}_total counter'.format(name))
+        label_text = ','.join(
+            '{}="{}"'.format(label, escape(label_value))
+            for label, label_value in labels
+        )
+        lines.append('lerkeveld_{}_total{} {}'.format(
+            name, '{' + label_text + '}' if label_text else '', value
+        ))
+
+    gauges = {}
+    for snapshot in snapshots:
+        for name, value in snapshot['gauges'].items():
+            gauges.setdefault(name, []).append((snapshot['pid'], value))
+    for name, values in sorted(gauges.items()):
+        lines.append('# TYPE lerkeveld_{} gauge'.format(name))
+        for pid, value in sorted(values):
+            lines.append('lerkeveld_{}{{pid="{}"}} {}'.format(name, pid, value))
+
+    return '\n'.join(lines) + '\n'
+
+
+@app.before_request
+def start_metrics_timer():
+    """
+    Starts the duration measurement of the request.
+    """
+    request.environ['metrics.start_time'] = time.perf_counter()
+
+
+def observe_request(status):
+    """
+    Records the current request with the given status in the counters and
+    histograms of its endpoint (once) and periodically writes the snapshot
+    of this process.
+    """
+    start_time = request.environ.pop('metrics.start_time', None)
+    if start_time is None or request.blueprint not in MEASURED_BLUEPRINTS:
+        return
+    registry.observe(
+        request.endpoint,
+        request.method,
+        status,
+        time.perf_counter() - start_time
+    )
+    interval = app.config['METRICS_WRITE_INTERVAL']
+    if app.config['METRICS_DIR'] and time.monotonic() - _last_write[0] >= interval:
+        write_snapshot()
+
+
+@app.after_request
+def record_metrics(response):
+    """
+    Records the request with the status of its response.
+    """
+    observe_request(response.status_code)
+    return response
+
+
+@app.teardown_request
+def record_failed_metrics(exc):
+    """
+    Records a request which failed with an unhandled exception as a 500
+    Internal Server Error. Exceptions are propagated (PROPAGATE_EXCEPTIONS),
+    so these requests skip the after request handlers.
+    """
+    if exc is not None:
+        observe_request(500)
+
+
+@atexit.register
+def write_final_snapshot():
+    """
+    Writes the snapshot of this process when it exits.
+    """
+    if app.config['METRICS_DIR']:
+        write_snapshot()
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    A view which presents the metrics of all processes in the Prometheus text
+    format. Requires the TOKEN_METRICS bearer token.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not check_token(token, app.config['TOKEN_METRICS']):
+        return abort(404)
+
+    return Response(
+        render(read_snapshots()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,28 +1,205 @@
+import sqlalchemy.event as event
+import sqlalchemy.orm as orm
 import sqlalchemy.sql as sql
 import datetime
+import time
 
+from sqlalchemy import DDL
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.hybrid import hybrid_property
 
-from app import db
+from app import app, db
 from app.security import (
-    generate_password_hash, check_password_hash, generate_random_password
+    generate_password_hash, check_password_hash, check_needs_rehash,
+    generate_random_password
 )
 
 association_user_group = db.Table(
     'association_user_group',
     db.Model.metadata,
     db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('group_id', db.Integer, db.ForeignKey('group.id'))
+    db.Column('group_id', db.Integer, db.ForeignKey('group.id')),
+    db.Index('ix_association_user_group', 'user_id', 'group_id', unique=True)
 )
 
 association_material_reservation_items = db.Table(
     'association_material_type',
     db.Model.metadata,
     db.Column('reservation_id', db.Integer, db.ForeignKey('material_reservation.id')),
-    db.Column('type_id', db.Integer, db.ForeignKey('material_type.id'))
+    db.Column('type_id', db.Integer, db.ForeignKey('material_type.id')),
+    db.Index('ix_association_material_type', 'reservation_id', 'type_id', unique=True)
 )
 
 
+class CatalogMixin(object):
+
+    """
+    Adds a cached lookup of ids by name to a small and rarely changing catalog
+    model. The cache is cleared when a write to the catalog is committed in
+    this process and expires after CATALOG_CACHE_TTL seconds for writes in
+    other processes.
+    """
+
+    _catalog = None
+    _generation = 0
+
+    @classmethod
+    def id_from_name(cls, name):
+        """
+        Returns the id of the catalog entry with the given name, or None.
+        """
+        catalog = cls._catalog
+        if catalog is None or catalog[0] < time.monotonic():
+            generation = cls._generation
+            # On duplicate names, the lowest id wins
+            ids = db.session.query(cls.name, cls.id).order_by(sql.desc(cls.id))
+            catalog = (time.monotonic() + app.config['CATALOG_CACHE_TTL'], dict(ids))
+            # Rows loaded before a commit cleared the cache may be outdated
+            if generation == cls._generation:
+                cls._catalog = catalog
+        return catalog[1].get(name)
+
+    @classmethod
+    def clear_catalog(cls):
+        """
+        Clears the cached lookup of ids by name.
+        """
+        cls._generation += 1
+        cls._catalog = None
+
+
+class SyncVersion(db.Model):
+
+    """
+    Represents the last sync version taken by a transaction writing a table.
+    A transaction takes its version by incrementing the row of the table,
+    which locks the row until the transaction ends, so versions increase in
+    commit order.
+    """
+
+    __tablename__ = 'sync_version'
+
+    name = db.Column(db.String, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+def seed_sync_versions(connection):
+    """
+    Inserts the missing sync version rows of the syncable tables.
+    """
+    existing = {name for name, in connection.execute(sql.select(SyncVersion.name))}
+    missing = [
+        {'name': model.__tablename__, 'version': 0}
+        for model in SyncMixin.__subclasses__()
+        if model.__tablename__ not in existing
+    ]
+    if missing:
+        connection.execute(SyncVersion.__table__.insert(), missing)
+
+
+@event.listens_for(SyncVersion.__table__, 'after_create')
+def create_sync_versions(target, connection, **kwargs):
+    seed_sync_versions(connection)
+
+
+class SyncMixin(object):
+
+    """
+    Adds a sync version, the time of the last change and a soft delete
+    tombstone to a model, so clients can fetch only the rows changed since
+    their last sync. Every written row gets the version of its transaction
+    (see SyncVersion), which serves as the cursor of the clients. Deleted
+    rows are kept (with deleted_at set) and should be filtered out by queries.
+    """
+
+    version = db.Column(db.BigInteger, nullable=False, default=0, index=True)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+        index=True
+    )
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    def soft_delete(self):
+        """
+        Marks this row as deleted.
+        """
+        self.deleted_at = datetime.datetime.utcnow()
+
+    @classmethod
+    def take_version(cls, session=None):
+        """
+        Returns the sync version of the current transaction for this table,
+        taking a new one on the first call. Writers of the table wait for each
+        other from then on until the transaction ends.
+        """
+        session = session or db.session
+        versions = session.info.setdefault('sync_versions', {})
+        name = cls.__tablename__
+        if name not in versions:
+            connection = session.connection()
+            connection.execute(
+                SyncVersion.__table__.update()
+                    .where(SyncVersion.name == name)
+                    .values(version=SyncVersion.version + 1)
+            )
+            versions[name] = connection.execute(
+                sql.select(SyncVersion.version).where(SyncVersion.name == name)
+            ).scalar_one()
+        return versions[name]
+
+    @classmethod
+    def filter_changes(cls, query, since=None):
+        """
+        Filters the given query on the rows which are not deleted or, given a
+        sync version, on all rows (including tombstones) written after it.
+        """
+        if since is None:
+            return query.filter(cls.deleted_at.is_(None))
+        return query.filter(cls.version > since)
+
+    @classmethod
+    def sync_state(cls):
+        """
+        Returns the last sync version and the time of the last change of any
+        row (both None without rows), in a single query.
+        """
+        return db.session.query(
+            sql.select(sql.func.max(cls.version)).scalar_subquery(),
+            sql.select(sql.func.max(cls.updated_at)).scalar_subquery()
+        ).one()
+
+
+@event.listens_for(orm.Session, 'before_flush')
+def assign_sync_versions(session, flush_context, instances):
+    """
+    Gives the new and changed syncable rows the sync version of the
+    transaction.
+    """
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, SyncMixin) and (
+            instance in session.new or session.is_modified(instance)
+        ):
+            instance.version = type(instance).take_version(session)
+
+
+@event.listens_for(orm.Session, 'after_transaction_end')
+def forget_sync_versions(session, transaction):
+    """
+    Forgets the sync versions taken in the ended transaction.
+    """
+    if transaction.parent is None:
+        session.info.pop('sync_versions', None)
+
+
 class User(db.Model):
 
     """
@@ -82,6 +259,12 @@ class User(db.Model):
         """
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self):
+        """
+        Returns whether the stored password hash uses outdated parameters.
+        """
+        return check_needs_rehash(self.password_hash)
+
     def set_email(self, email):
         """
         Set the email of this user to the given email in lower case.
@@ -146,13 +329,21 @@ class Group(db.Model):
         return '<Group {}>'.format(self.name)
 
 
-class KotbarReservation(db.Model):
+class KotbarReservation(SyncMixin, db.Model):
 
     """
     Represents a database model of a reservation of the kotbar.
     """
 
     __tablename__ = 'kotbar_reservation'
+    __table_args__ = (
+        # A date can be booked again after its reservation is deleted
+        db.Index(
+            'ix_kotbar_reservation_date_active', 'date', unique=True,
+            sqlite_where=sql.text('deleted_at IS NULL'),
+            postgresql_where=sql.text('deleted_at IS NULL')
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -168,17 +359,28 @@ class KotbarReservation(db.Model):
         date.
         """
         return cls.query.filter(
-            cls.date.between(start_date, end_date)
+            cls.date.between(start_date, end_date),
+            cls.deleted_at.is_(None)
         ).order_by(sql.desc(cls.date)).all()
 
     @classmethod
-    def get_all_after(cls, start_date):
+    def get_all_after(cls, start_date, eager=False, ascending=False,
+                      end_date=None, since=None):
         """
-        Returns all kotbar reservations after the given start date.
+        Returns all kotbar reservations after the given start date (up to and
+        including the end date), latest first unless ascending. Given a sync
+        version, only the reservations written after it are returned,
+        including the deleted ones. If eager, the users are loaded in the same
+        query.
         """
-        return cls.query.filter(
-            cls.date > start_date
-        ).order_by(sql.desc(cls.date)).all()
+        query = cls.query.filter(cls.date > start_date)
+        if end_date is not None:
+            query = query.filter(cls.date <= end_date)
+        query = cls.filter_changes(query, since)
+        if eager:
+            query = query.options(orm.joinedload(cls.user))
+        order = cls.date if ascending else sql.desc(cls.date)
+        return query.order_by(order).all()
 
     @classmethod
     def is_booked(cls, date):
@@ -188,16 +390,65 @@ class KotbarReservation(db.Model):
         return db.session.query(
             sql.exists()
                .where(cls.date == date)
+               .where(cls.deleted_at.is_(None))
         ).scalar()
 
-
-class MaterialReservation(db.Model):
+    @classmethod
+    def reserve(cls, user, date, description):
+        """
+        Reserves the kotbar at the given date for the given user. The date is
+        claimed by a single insert which does nothing when the date is already
+        booked, so concurrent reservations of the same date have exactly one
+        winner. Returns the reservation, or None if the date is already booked.
+        """
+        values = {
+            'user_id': user.id,
+            'date': date,
+            'description': description,
+            'version': cls.take_version(),
+            'updated_at': datetime.datetime.utcnow(),
+            'deleted_at': None,
+        }
+        dialect = db.engine.dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            statement = insert(cls.__table__) \
+                .values(**values) \
+                .on_conflict_do_nothing(
+                    index_elements=[cls.date],
+                    index_where=cls.deleted_at.is_(None)
+                )
+            if dialect == 'postgresql':
+                statement = statement.returning(cls.id)
+            result = db.session.execute(statement)
+            if result.rowcount != 1:
+                return None
+            reservation_id = result.scalar() if dialect == 'postgresql' else result.lastrowid
+        else:
+            # Other databases report the conflict as a violated unique index
+            try:
+                with db.session.begin_nested():
+                    result = db.session.execute(cls.__table__.insert().values(**values))
+            except IntegrityError:
+                return None
+            reservation_id = result.inserted_primary_key[0]
+
+        # The inserted row is known, so the instance is built without a query
+        reservation = cls(id=reservation_id, **values)
+        orm.make_transient_to_detached(reservation)
+        db.session.add(reservation)
+        orm.attributes.set_committed_value(reservation, 'user', user)
+        return reservation
+
+
+class MaterialReservation(SyncMixin, db.Model):
 
     __tablename__ = 'material_reservation'
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
 
     user = db.relationship('User')
     items = db.relationship(
@@ -210,13 +461,25 @@ class MaterialReservation(db.Model):
         )
 
     @classmethod
-    def get_all_after(cls, start_date):
+    def get_all_after(cls, start_date, eager=False, end_date=None,
+                      since=None):
         """
-        Returns all material reservations after the given start date.
+        Returns all material reservations after the given start date (up to
+        and including the end date). Given a sync version, only the
+        reservations written after it are returned, including the deleted
+        ones. If eager, the users are loaded in the same query and the items
+        in one additional query.
         """
-        return cls.query.filter(
-            cls.date > start_date
-        ).order_by(sql.desc(cls.date)).all()
+        query = cls.query.filter(cls.date > start_date)
+        if end_date is not None:
+            query = query.filter(cls.date <= end_date)
+        query = cls.filter_changes(query, since)
+        if eager:
+            query = query.options(
+                orm.joinedload(cls.user),
+                orm.selectinload(cls.items)
+            )
+        return query.order_by(sql.desc(cls.date)).all()
 
 
 class MaterialType(db.Model):
@@ -237,6 +500,10 @@ class MaterialType(db.Model):
 class BreadOrder(db.Model):
 
     __tablename__ = 'bread_order'
+    __table_args__ = (
+        db.Index('ix_bread_order_user_id_date_id', 'user_id', 'date_id'),
+        db.Index('ix_bread_order_date_id_type_id', 'date_id', 'type_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -258,21 +525,32 @@ class BreadOrderDate(db.Model):
     __tablename__ = 'bread_order_date'
 
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
 
-    @property
+    @hybrid_property
     def is_editable(self):
+        """
+        Returns whether orders on this date can still be changed: the date is
+        active and more than two days away. Can also be used in queries.
+        """
         return (self.is_active and
                 self.date - datetime.date.today() > datetime.timedelta(days=2))
 
+    @is_editable.expression
+    def is_editable(cls):
+        return sql.and_(
+            cls.is_active,
+            cls.date > datetime.date.today() + datetime.timedelta(days=2)
+        )
+
     def __repr__(self):
         return '<BreadOrderDate {} ({}active)>'.format(
             self.date, "in"*(not self.is_active)
         )
 
 
-class BreadType(db.Model):
+class BreadType(CatalogMixin, db.Model):
 
     __tablename__ = 'bread_type'
 
@@ -288,3 +566,125 @@ class BreadType(db.Model):
         return cls.query.filter_by(name=name).first()
 
 
+class BreadOrderCount(db.Model):
+
+    """
+    Represents the number of orders of a bread type on an order date. The
+    counts are maintained by triggers on bread_order (SQLite and PostgreSQL),
+    so they also follow bulk statements. Counts of zero are kept.
+    """
+
+    __tablename__ = 'bread_order_count'
+
+    date_id = db.Column(db.Integer, db.ForeignKey('bread_order_date.id'), primary_key=True)
+    type_id = db.Column(db.Integer, db.ForeignKey('bread_type.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<BreadOrderCount {} of {} on {}>'.format(
+            self.count, self.type_id, self.date_id
+        )
+
+
+# The triggers are created after all tables, since they reference both
+# bread_order and bread_order_count. The statements can be run repeatedly.
+BREAD_ORDER_COUNT_TRIGGERS = {
+    'sqlite': [
+        """
+        CREATE TRIGGER IF NOT EXISTS bread_order_count_insert
+        AFTER INSERT ON bread_order
+        WHEN NEW.date_id IS NOT NULL AND NEW.type_id IS NOT NULL
+        BEGIN
+            INSERT INTO bread_order_count (date_id, type_id, count)
+            VALUES (NEW.date_id, NEW.type_id, 1)
+            ON CONFLICT (date_id, type_id) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS bread_order_count_delete
+        AFTER DELETE ON bread_order
+        BEGIN
+            UPDATE bread_order_count SET count = count - 1
+            WHERE date_id = OLD.date_id AND type_id = OLD.type_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS bread_order_count_update
+        AFTER UPDATE OF date_id, type_id ON bread_order
+        BEGIN
+            UPDATE bread_order_count SET count = count - 1
+            WHERE date_id = OLD.date_id AND type_id = OLD.type_id;
+            INSERT INTO bread_order_count (date_id, type_id, count)
+            SELECT NEW.date_id, NEW.type_id, 1
+            WHERE NEW.date_id IS NOT NULL AND NEW.type_id IS NOT NULL
+            ON CONFLICT (date_id, type_id) DO UPDATE SET count = count + 1;
+        END
+        """,
+    ],
+    'postgresql': [
+        """
+        CREATE OR REPLACE FUNCTION bread_order_count_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE bread_order_count SET count = count - 1
+                WHERE date_id = OLD.date_id AND type_id = OLD.type_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF NEW.date_id IS NOT NULL AND NEW.type_id IS NOT NULL THEN
+                    INSERT INTO bread_order_count (date_id, type_id, count)
+                    VALUES (NEW.date_id, NEW.type_id, 1)
+                    ON CONFLICT (date_id, type_id)
+                    DO UPDATE SET count = bread_order_count.count + 1;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS bread_order_count ON bread_order",
+        """
+        CREATE TRIGGER bread_order_count
+        AFTER INSERT OR DELETE OR UPDATE OF date_id, type_id ON bread_order
+        FOR EACH ROW EXECUTE PROCEDURE bread_order_count_trigger()
+        """,
+    ],
+}
+
+for dialect, statements in BREAD_ORDER_COUNT_TRIGGERS.items():
+    for statement in statements:
+        event.listen(
+            db.Model.metadata,
+            'after_create',
+            DDL(statement).execute_if(dialect=dialect)
+        )
+
+
+@event.listens_for(orm.Session, 'after_flush')
+def remember_written_catalogs(session, flush_context):
+    """
+    Remembers the catalogs written in the flush, which are cleared when the
+    transaction commits.
+    """
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, CatalogMixin):
+            session.info.setdefault('written_catalogs', set()).add(type(instance))
+
+
+@event.listens_for(orm.Session, 'after_commit')
+def clear_written_catalogs(session):
+    """
+    Clears the cached lookups of the catalogs written in the committed
+    transaction. Clearing them before the commit would let another thread
+    cache the old rows again.
+    """
+    for catalog in session.info.pop('written_catalogs', ()):
+        catalog.clear_catalog()
+
+
+@event.listens_for(orm.Session, 'after_transaction_end')
+def forget_written_catalogs(session, transaction):
+    """
+    Forgets the catalogs written in a rolled back transaction.
+    """
+    if transaction.parent is None:
+        session.info.pop('written_catalogs', None)
@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import uuid
+
+import sqlalchemy as sqla
+from flask import Response, request
+from sqlalchemy import orm
+
+from app import app
+from app.api import api
+from app.cache import create_cache
+
+response_cache = create_cache(
+    app,
+    'responses',
+    ttl=app.config['RESPONSE_CACHE_TTL'],
+    size=app.config['RESPONSE_CACHE_SIZE']
+)
+
+# The generation of a model outlives the responses cached for it
+GENERATION_TTL = 30 * 24 * 60 * 60
+
+# The tables of the models of which the writes invalidate cached responses
+_watched_tables = set()
+
+
+def _invalidate_table(table):
+    """
+    Starts and returns a new generation of the given table.
+    """
+    generation = uuid.uuid4().hex
+    response_cache.set(('generation', table), generation, ttl=GENERATION_TTL)
+    return generation
+
+
+def _generation(table):
+    """
+    Returns the current generation of the given table. A cached response is
+    stored under the generations of its models, so a new generation makes all
+    responses cached for the table unreachable.
+    """
+    key = ('generation', table)
+    generation = response_cache.get(key)
+    if generation is None:
+        generation = _invalidate_table(table)
+    return generation
+
+
+def invalidate_model(model):
+    """
+    Invalidates all cached responses which depend on the given model. Writes
+    through the session invalidate automatically; this should be called after
+    bulk statements which bypass the session.
+    """
+    _invalidate_table(model.__tablename__)
+
+
+def watch_models(models):
+    """
+    Registers the given models, so writes through the session start a new
+    generation of their tables.
+    """
+    for model in models:
+        _watched_tables.add(model.__tablename__)
+
+
+def generations(models):
+    """
+    Returns the current generations of the given (watched) models, to be used
+    in the key of a value cached until one of the models is written.
+    """
+    return tuple(_generation(model.__tablename__) for model in models)
+
+
+def cached_value(key, models, compute, ttl=None):
+    """
+    Returns the value cached under the given key until the given time to live
+    expires or one of the given (watched) models is written. Missing values
+    are computed by calling compute.
+    """
+    cache_key = (key, generations(models))
+    value = response_cache.get(cache_key)
+    if value is None:
+        value = compute()
+        response_cache.set(cache_key, value, ttl=ttl)
+    return value
+
+
+def cached_response(key, models, ttl=None):
+    """
+    Decorates a resource method returning a (JSON serializable) dictionary.
+    The serialized response is cached under the given key (a string or a
+    function of the arguments of the method) until the given time to live
+    expires or one of the given models is written. Responses carry an ETag and
+    are answered with 304 Not Modified when the client has an up to date copy.
+    """
+    watch_models(models)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache_key = (
+                key(*args, **kwargs) if callable(key) else key,
+                generations(models)
+            )
+            cached = response_cache.get(cache_key)
+            if cached is None:
+                response = api.make_response(fn(*args, **kwargs), 200)
+                if response.status_code != 200:
+                    return response
+                data = response.get_data()
+                cached = (data, hashlib.sha1(data).hexdigest())
+                response_cache.set(cache_key, cached, ttl=ttl)
+
+            data, etag = cached
+            response = Response(data, mimetype='application/json')
+            response.set_etag(etag)
+            # Authenticated data, which browsers should revalidate before use
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+@sqla.event.listens_for(orm.Session, 'after_flush')
+def collect_written_tables(session, flush_context):
+    """
+    Remembers the watched tables written in the flush until the transaction
+    ends.
+    """
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(instance, '__tablename__', None)
+        if table in _watched_tables:
+            session.info.setdefault('written_tables', set()).add(table)
+
+
+@sqla.event.listens_for(orm.Session, 'after_commit')
+def invalidate_written_tables(session):
+    """
+    Invalidates the cached responses of the tables written in the committed
+    transaction.
+    """
+    for table in session.info.pop('written_tables', ()):
+        _invalidate_table(table)
+
+
+@sqla.event.listens_for(orm.Session, 'after_rollback')
+def forget_written_tables(session):
+    """
+    Forgets the written tables of the rolled back transaction.
+    """
+    session.info.pop('written_tables', None)
@@ -1,11 +1,108 @@
+import hmac
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import argon2
 from itsdangerous import URLSafeTimedSerializer
+from werkzeug.exceptions import ServiceUnavailable
 
 from app import app
 
 
+class PasswordHasherBusy(ServiceUnavailable):
+    """
+    Raised when no password hashing slot becomes available in time.
+    """
+    description = 'Te veel aanvragen, probeer later opnieuw'
+
+
+def create_password_hasher(config):
+    """
+    Returns an argon2 password hasher with the cost parameters of the given
+    configuration.
+    """
+    return argon2.PasswordHasher(
+        time_cost=config['ARGON2_TIME_COST'],
+        memory_cost=config['ARGON2_MEMORY_COST'],
+        parallelism=config['ARGON2_PARALLELISM'],
+        hash_len=32
+    )
+
+
+# argon2 is CPU and memory heavy, so it runs on a small dedicated pool
+password_hasher = None
+_hash_config = {}
+_hash_slots = None
+_hash_lock = threading.Lock()
+_hash_executor = None
+_hash_executor_pid = None
+_hash_stats = {'active': 0, 'rejected': 0}
+
+
+def configure_password_hashing(config):
+    """
+    (Re)creates the password hasher and the password hashing pool with the
+    cost parameters and pool settings of the given configuration.
+    """
+    global password_hasher, _hash_slots, _hash_executor, _hash_executor_pid
+    with _hash_lock:
+        password_hasher = create_password_hasher(config)
+        _hash_config['workers'] = config['PASSWORD_HASH_WORKERS']
+        _hash_config['timeout'] = config['PASSWORD_HASH_QUEUE_TIMEOUT']
+        _hash_slots = threading.BoundedSemaphore(_hash_config['workers'])
+        if _hash_executor is not None:
+            _hash_executor.shutdown(wait=False)
+        _hash_executor = None
+        _hash_executor_pid = None
+
+
+configure_password_hashing(app.config)
+
+
+def _get_hash_executor():
+    """
+    Returns the password hashing pool, creating it in a freshly forked process.
+    """
+    global _hash_executor, _hash_executor_pid
+    with _hash_lock:
+        if _hash_executor_pid != os.getpid():
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=_hash_config['workers'],
+                thread_name_prefix='argon2'
+            )
+            _hash_executor_pid = os.getpid()
+        return _hash_executor
+
+
+def _run_hasher(fn, *args):
+    """
+    Runs the given password hasher function on the password hashing pool.
+    Raises PasswordHasherBusy if no slot becomes available in time.
+    """
+    slots = _hash_slots
+    if not slots.acquire(timeout=_hash_config['timeout']):
+        with _hash_lock:
+            _hash_stats['rejected'] += 1
+        raise PasswordHasherBusy()
+    try:
+        with _hash_lock:
+            _hash_stats['active'] += 1
+        return _get_hash_executor().submit(fn, *args).result()
+    finally:
+        with _hash_lock:
+            _hash_stats['active'] -= 1
+        slots.release()
+
+
+def password_hash_stats():
+    """
+    Returns the number of active and rejected password hash computations.
+    """
+    with _hash_lock:
+        return dict(_hash_stats)
+
+
 def generate_random_password(N):
     """
     Generates a random password of given length.
@@ -17,21 +114,40 @@ def generate_password_hash(password):
     """
     Hash a password with the argon2 key derivation function.
     """
-    password_hasher = argon2.PasswordHasher(hash_len=32)
-    return password_hasher.hash(password)
+    return _run_hasher(password_hasher.hash, password)
 
 
 def check_password_hash(password_hash, password):
     """
     Check a password against a given hashed password value.
     """
-    password_hasher = argon2.PasswordHasher(hash_len=32)
     try:
-        return password_hasher.verify(password_hash, password)
+        return _run_hasher(password_hasher.verify, password_hash, password)
     except argon2.exceptions.VerificationError:
         return False
 
 
+def check_needs_rehash(password_hash):
+    """
+    Returns whether the given hashed password value was created with outdated
+    cost parameters.
+    """
+    return password_hasher.check_needs_rehash(password_hash)
+
+
+def check_token(token, expected):
+    """
+    Returns whether the given token equals the expected secret token, in
+    constant time. The expected token may be a string or bytes (the random
+    default); nothing matches a token which is not configured.
+    """
+    if not token or not expected:
+        return False
+    if isinstance(expected, str):
+        expected = expected.encode('utf-8')
+    return hmac.compare_digest(token.encode('utf-8'), expected)
+
+
 def dump_token(obj, salt):
     """
     Returns the url safe signed object with given salt and time of creation
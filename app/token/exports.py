@@ -0,0 +1,67 @@
+import collections
+import csv
+
+
+class _Line(object):
+
+    """
+    Represents a file which returns the written value, so the csv writer
+    returns its formatted lines.
+    """
+
+    def write(self, value):
+        return value
+
+
+def week_orders_csv(rows):
+    """
+    Yields the lines of a CSV file with the given week order rows (see
+    stream_week_orders), a subtotal per bread type after every corridor and
+    the totals per bread type at the end. The rows are only iterated once.
+    """
+    writer = csv.writer(_Line())
+    yield writer.writerow(['Gang', 'Kamer', 'Naam', 'Brood', 'Aantal'])
+
+    def subtotal_rows(label, corridor, counts):
+        for name, count in sorted(counts.items()):
+            yield writer.writerow([corridor, '', label, name, count])
+
+    totals = collections.Counter()
+    subtotals = collections.Counter()
+    current_corridor = None
+    for corridor, room, first_name, last_name, name, count in rows:
+        corridor = corridor or ''
+        if subtotals and corridor != current_corridor:
+            yield from subtotal_rows('Subtotaal', current_corridor, subtotals)
+            subtotals = collections.Counter()
+        current_corridor = corridor
+        subtotals[name] += count
+        totals[name] += count
+        yield writer.writerow([
+            corridor, room or '', '{} {}'.format(first_name, last_name), name, count
+        ])
+    if subtotals:
+        yield from subtotal_rows('Subtotaal', current_corridor, subtotals)
+    yield from subtotal_rows('Totaal', '', totals)
+
+
+def bread_report_csv(report):
+    """
+    Yields the lines of a CSV file with a row per order date of the given
+    bread report (see get_order_report), with a column per bread type, the
+    revenue in euro and the totals at the end.
+    """
+    writer = csv.writer(_Line())
+    yield writer.writerow(['Datum'] + report['types'] + ['Omzet'])
+
+    def euro(cents):
+        return '{:.2f}'.format(cents / 100)
+
+    for entry in report['dates']:
+        yield writer.writerow(
+            [entry['date']] + entry['counts'] + [euro(entry['revenue'])]
+        )
+    totals = report['totals']
+    yield writer.writerow(
+        ['Totaal'] + totals['counts'] + [euro(totals['revenue'])]
+    )
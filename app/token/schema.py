@@ -1,8 +1,38 @@
-from marshmallow import fields
+import datetime
+
+from marshmallow import fields, ValidationError, post_load
 from marshmallow.validate import Length
 
-from app import ma
+from app import app, ma
+from app.api.bread.queries import get_semester
 
 
 class ResetSchema(ma.Schema):
     password = fields.String(required=True, validate=Length(8))
+
+
+class BreadReportSchema(ma.Schema):
+    start_date = fields.Date(data_key='from')
+    end_date = fields.Date(data_key='to')
+
+    @post_load
+    def fill_range(self, data, **kwargs):
+        """
+        Defaults the range to the current semester (or the rest of the semester
+        of the given start) and validates whether it is not reversed or too
+        long.
+        """
+        if 'start_date' not in data:
+            data['start_date'], _ = get_semester(datetime.date.today())
+        if 'end_date' not in data:
+            _, data['end_date'] = get_semester(data['start_date'])
+
+        days = (data['end_date'] - data['start_date']).days + 1
+        if days < 1:
+            raise ValidationError('From should not be after to.')
+        max_days = app.config['BREAD_REPORT_MAX_DAYS']
+        if days > max_days:
+            raise ValidationError(
+                'The range should be at most {} days.'.format(max_days)
+            )
+        return data
@@ -1,20 +1,36 @@
 import datetime
 import marshmallow as ma
 
-from flask import render_template, request, abort
+from flask import (
+    Response, render_template, request, abort, stream_with_context, url_for
+)
 from itsdangerous import BadData, SignatureExpired
 
 from app import app, db
+from app.identity import invalidate_user
 from app.models import User, KotbarReservation, BreadOrderDate
-from app.security import load_token
+from app.response_cache import cached_value, watch_models
+from app.security import check_token, load_token
 from app.token import token_blueprint
 from app.api.bread.queries import (
+    get_order_report,
     get_week_order_detailed,
-    get_week_order_totals
+    get_week_order_totals,
+    stream_week_orders
 )
-from .schema import ResetSchema
+from .exports import bread_report_csv, week_orders_csv
+from .schema import BreadReportSchema, ResetSchema
 
 reset_schema = ResetSchema()
+bread_report_schema = BreadReportSchema()
+
+# The models of which the writes invalidate the cached overview pages
+OVERVIEW_MODELS = {
+    'kotbar': (KotbarReservation, User),
+    'bread': (BreadOrderDate,),
+}
+for models in OVERVIEW_MODELS.values():
+    watch_models(models)
 
 
 @token_blueprint.route('/activate/<token>', methods=['GET'])
@@ -36,6 +52,7 @@ def activate(token):
     user.is_activated = True
     db.session.add(user)
     db.session.commit()
+    invalidate_user(user)
     return render_template('token/activation.html')
 
 
@@ -64,6 +81,7 @@ def reset(token):
             user.set_password(data.get('password'))
             db.session.add(user)
             db.session.commit()
+            invalidate_user(user)
             return render_template('token/reset_success.html')
         except ma.ValidationError as err:
             errors = err.messages
@@ -74,36 +92,52 @@ def reset(token):
 @token_blueprint.route('/kotbar_reservations/<token>', methods=['GET'])
 def kotbar_reservations(token):
     """
-    A view which presents the user with the coming kotbar reservations.
+    A view which presents the user with the coming kotbar reservations. The
+    page is cached until a reservation or user is written.
     """
-    if token != app.config.get('TOKEN_KOTBAR_RESERVATIONS', None):
+    if not check_token(token, app.config.get('TOKEN_KOTBAR_RESERVATIONS', None)):
         return render_template('token/failure.html')
 
-    yesterday = datetime.date.today() - datetime.timedelta(1)
-    reservations = KotbarReservation.get_all_after(yesterday)
-    reservations = sorted(reservations, key=lambda r: r.date)
+    today = datetime.date.today()
 
-    return render_template(
-        'token/kotbar_reservations.html',
-        reservations=reservations
+    def render():
+        yesterday = today - datetime.timedelta(1)
+        return render_template(
+            'token/kotbar_reservations.html',
+            reservations=KotbarReservation.get_all_after(
+                yesterday, eager=True, ascending=True
+            )
+        )
+
+    return cached_value(
+        ('token.kotbar_reservations', today), OVERVIEW_MODELS['kotbar'], render
     )
 
 
 @token_blueprint.route('/bread_reservations/<token>', methods=['GET'])
 def bread_reservations(token):
     """
-    A view which presents the user with the current bread reservations.
+    A view which presents the user with the current bread reservations. The
+    page is cached until an order date is written.
     """
-    if token != app.config.get('TOKEN_BREAD_RESERVATIONS', None):
+    if not check_token(token, app.config.get('TOKEN_BREAD_RESERVATIONS', None)):
         return render_template('token/failure.html')
 
-    reservations = BreadOrderDate.query.all()
-    reservations = sorted(reservations, key=lambda r: r.date)
-
-    return render_template(
-        'token/bread_reservations.html',
-        reservations=reservations,
-        token=token
+    def render():
+        reservations = BreadOrderDate.query \
+                                     .order_by(BreadOrderDate.date, BreadOrderDate.id) \
+                                     .all()
+        return render_template(
+            'token/bread_reservations.html',
+            reservations=reservations,
+            token=token
+        )
+
+    # Whether a date is editable depends on the current date
+    return cached_value(
+        ('token.bread_reservations', datetime.date.today()),
+        OVERVIEW_MODELS['bread'],
+        render
     )
 
 
@@ -112,7 +146,7 @@ def bread_reservation(token, odi):
     """
     A view which presents the user with the bread reservation of a week.
     """
-    if token != app.config.get('TOKEN_BREAD_RESERVATIONS', None):
+    if not check_token(token, app.config.get('TOKEN_BREAD_RESERVATIONS', None)):
         return render_template('token/failure.html')
 
     order_date = BreadOrderDate.query.get(odi)
@@ -126,5 +160,71 @@ def bread_reservation(token, odi):
     return render_template(
         'token/bread_reservation_week.html',
         orders=orders,
-        totals=totals
+        totals=totals,
+        csv_url=url_for('token.bread_reservation_csv', odi=odi, token=token)
+    )
+
+
+@token_blueprint.route('/bread_reservation/<int:odi>/<token>.csv', methods=['GET'])
+def bread_reservation_csv(token, odi):
+    """
+    A view which streams the bread reservation of a week as a CSV file, with
+    subtotals per corridor and totals per bread type.
+    """
+    if not check_token(token, app.config.get('TOKEN_BREAD_RESERVATIONS', None)):
+        return render_template('token/failure.html')
+
+    order_date = BreadOrderDate.query.get(odi)
+    if not order_date:
+        return abort(404)
+
+    rows = stream_week_orders(order_date)
+    filename = 'brood-{}.csv'.format(order_date.date.isoformat())
+    return Response(
+        stream_with_context(week_orders_csv(rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="{}"'.format(filename)}
+    )
+
+
+def load_bread_report(token):
+    """
+    Returns the bread report for the range given by the from and to
+    parameters, or an error response.
+    """
+    if not check_token(token, app.config.get('TOKEN_BREAD_RESERVATIONS', None)):
+        return None, render_template('token/failure.html')
+    try:
+        data = bread_report_schema.load(request.args)
+    except ma.ValidationError as err:
+        return None, ({'msg': '400 Bad Request', 'errors': err.messages}, 400)
+    return get_order_report(data['start_date'], data['end_date']), None
+
+
+@token_blueprint.route('/bread_report/<token>', methods=['GET'])
+def bread_report(token):
+    """
+    A view which presents the number of orders and the revenue per bread type
+    for every order date in a range (by default the current semester) as JSON.
+    """
+    report, error = load_bread_report(token)
+    if error:
+        return error
+    return dict(report, success=True)
+
+
+@token_blueprint.route('/bread_report/<token>.csv', methods=['GET'])
+def bread_report_csv_view(token):
+    """
+    A view which streams the bread report of a range as a CSV file.
+    """
+    report, error = load_bread_report(token)
+    if error:
+        return error
+
+    filename = 'brood-{}-{}.csv'.format(report['from'], report['to'])
+    return Response(
+        bread_report_csv(report),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="{}"'.format(filename)}
     )
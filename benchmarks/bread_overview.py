@@ -0,0 +1,81 @@
+"""
+Bread overview benchmark: measures the statement count and latency of the
+bread overview of a user (queries.get_order_dates_extended) for a number of
+order dates with a number of orders each.
+
+Run from the repository root:
+
+    python -m benchmarks.bread_overview [--dates N] [--orders N]
+                                        [--iterations N]
+"""
+import argparse
+import datetime
+import json
+import time
+
+from app import app, db
+from app.api.bread import queries
+from app.models import BreadOrder, BreadOrderDate, BreadType, User
+from . import common
+
+
+def seed(dates, orders):
+    """
+    Inserts a bread catalog, the given number of order dates and the given
+    number of orders per date for a single user. Returns the user id.
+    """
+    common.seed_users(1, 'unused')
+    with app.app_context():
+        db.session.execute(BreadType.__table__.insert(), [
+            {'name': 'type {}'.format(i), 'price': 100 + i} for i in range(5)
+        ])
+        today = datetime.date.today()
+        db.session.execute(BreadOrderDate.__table__.insert(), [
+            {'date': today + datetime.timedelta(days=i), 'is_active': True}
+            for i in range(dates)
+        ])
+        user_id = db.session.query(User.id).scalar()
+        db.session.execute(BreadOrder.__table__.insert(), [
+            {'user_id': user_id, 'date_id': date_id, 'type_id': 1 + i % 5}
+            for date_id in range(1, dates + 1)
+            for i in range(orders)
+        ])
+        db.session.commit()
+    return user_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dates', type=int, default=30)
+    parser.add_argument('--orders', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    common.setup_database(args.database_uri)
+    user_id = seed(args.dates, args.orders)
+    after_date = datetime.date.today() - datetime.timedelta(days=1)
+
+    latencies = []
+    with app.app_context():
+        user = User.query.get(user_id)
+        with common.count_statements() as statements:
+            list(queries.get_order_dates_extended(user, after_date))
+        for _ in range(args.iterations):
+            db.session.expire_all()
+            start = time.perf_counter()
+            list(queries.get_order_dates_extended(user, after_date))
+            latencies.append(time.perf_counter() - start)
+
+    result = common.summarize(latencies, sum(latencies))
+    result['statements'] = len(statements)
+    print(json.dumps({
+        'environment': common.environment(),
+        'dates': args.dates,
+        'orders_per_date': args.orders,
+        'result': result,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Shared helpers for the benchmarks: a throwaway SQLite database with synthetic
+data, statement counting, latency percentiles and a threaded load driver.
+"""
+import contextlib
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+
+import sqlalchemy as sqla
+
+from app import app, db
+from app.models import User
+
+
+def setup_database(database_uri=None):
+    """
+    Points the application to the given database, or a new SQLite database in
+    a temporary directory, and creates all tables.
+    """
+    if database_uri is None:
+        directory = tempfile.mkdtemp(prefix='lerkeveld-bench-')
+        database_uri = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['JWT_COOKIE_SECURE'] = False
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    with app.app_context():
+        db.create_all()
+    return database_uri
+
+
+def seed_users(count, password_hash, prefix='user', activated=True):
+    """
+    Inserts the given number of synthetic users sharing the given password
+    hash. Returns their email addresses.
+    """
+    rows = [{
+        'first_name': 'User',
+        'last_name': str(i),
+        'email': '{}{}@example.com'.format(prefix, i),
+        'corridor': 'N{}'.format(i % 4),
+        'room': str(i),
+        'is_admin': False,
+        'is_activated': activated,
+        'is_sharing': i % 2 == 0,
+        'password_hash': password_hash,
+    } for i in range(count)]
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+    return [row['email'] for row in rows]
+
+
+@contextlib.contextmanager
+def count_statements():
+    """
+    Counts the SQL statements executed within the block. Yields a list which
+    receives the executed statements.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    sqla.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sqla.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def summarize(latencies, elapsed):
+    """
+    Returns the request rate and latency percentiles (in milliseconds) of the
+    given latencies (in seconds) measured over the given elapsed time.
+    """
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))
+        return latencies[index] * 1000
+
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+
+def run_load(setup, request, workers, requests):
+    """
+    Runs the given number of requests spread over the given number of worker
+    threads. Each worker calls setup() once and request(state) for every
+    request, which should return the response status code.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(count):
+        state = setup()
+        barrier.wait()
+        for _ in range(count):
+            start = time.perf_counter()
+            status = request(state)
+            latency = time.perf_counter() - start
+            with lock:
+                latencies.append(latency)
+                if status >= 400:
+                    errors.append(status)
+
+    threads = [
+        threading.Thread(target=worker, args=(
+            requests // workers + (i < requests % workers),
+        ))
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - start)
+    result['errors'] = len(errors)
+    return result
+
+
+def environment():
+    """
+    Returns a description of the environment the benchmark ran in.
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark comparing the cost of building a kotbar confirmation email
+with cached templates and attachment parts against rendering the templates and
+encoding the attachment on every send.
+
+Run from the repository root:
+
+    python -m benchmarks.emails [--iterations N]
+"""
+import argparse
+import datetime
+import json
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from flask import render_template
+from flask_mail import Message
+
+from app import app
+from app.emails import KOTBAR_RESERVATION, KOTBAR_RULES
+from app.messages import PreparedMessage
+
+with app.open_resource('assets/kotbar_rules.pdf') as f:
+    RAW_KOTBAR_RULES = f.read()
+
+
+def build_uncached(reservation):
+    msg = Message()
+    msg.subject = 'Lerkeveld Underground - Bevestiging Reservatie'
+    msg.add_recipient(reservation.user.email)
+    msg.body = render_template(
+        'emails/kotbar_reservation.txt', reservation=reservation
+    )
+    msg.html = render_template(
+        'emails/kotbar_reservation.html', reservation=reservation
+    )
+    msg.attach(
+        'kotbar_rules.pdf',
+        'application/pdf',
+        RAW_KOTBAR_RULES,
+        'attachment; filename="kotbar_rules.pdf"'
+    )
+    return msg.as_bytes()
+
+
+def build_cached(reservation):
+    msg = PreparedMessage(
+        KOTBAR_RESERVATION,
+        parts=[KOTBAR_RULES],
+        reservation=reservation
+    )
+    msg.subject = 'Lerkeveld Underground - Bevestiging Reservatie'
+    msg.add_recipient(reservation.user.email)
+    return msg.as_bytes()
+
+
+def measure(build, reservation, iterations):
+    build(reservation)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build(reservation)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    build(reservation)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'us_per_message': elapsed / iterations * 1e6,
+        'peak_bytes': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    user = SimpleNamespace(
+        first_name='Test', fullname='Test Test', email='test@example.com'
+    )
+    reservation = SimpleNamespace(
+        user=user, date=datetime.date.today(), description='Benchmark'
+    )
+
+    with app.test_request_context():
+        results = {
+            'uncached': measure(build_uncached, reservation, args.iterations),
+            'cached': measure(build_cached, reservation, args.iterations),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Kotbar booking stress test: lets many threads reserve the same dates at the
+same moment through /api/kotbar/ and checks that every date has exactly one
+winner, both in the responses and in the database.
+
+Run from the repository root:
+
+    python -m benchmarks.kotbar_booking [--threads N] [--dates N]
+"""
+import argparse
+import collections
+import datetime
+import json
+import sys
+import threading
+import time
+
+from app import app, db, security
+from app.models import KotbarReservation
+from . import common
+
+PASSWORD = 'benchmark-password'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--dates', type=int, default=20)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    common.setup_database(args.database_uri)
+    # Logging in is not measured, so cheap hashes keep the setup fast
+    security.configure_password_hashing(dict(
+        app.config, ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024,
+        ARGON2_PARALLELISM=1, PASSWORD_HASH_QUEUE_TIMEOUT=None
+    ))
+    emails = common.seed_users(
+        args.threads, security.generate_password_hash(PASSWORD)
+    )
+
+    first_date = datetime.date.today() + datetime.timedelta(days=1)
+    dates = [
+        (first_date + datetime.timedelta(days=i)).isoformat()
+        for i in range(args.dates)
+    ]
+    statuses = collections.defaultdict(collections.Counter)
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(email):
+        client = app.test_client()
+        tokens = client.post(
+            '/api/auth/login', json={'email': email, 'password': PASSWORD}
+        ).json
+        for date in dates:
+            # All threads race for the same date
+            barrier.wait()
+            start = time.perf_counter()
+            response = client.post(
+                '/api/kotbar/',
+                json={'date': date, 'description': email},
+                headers={'X-CSRF-TOKEN': tokens['a-csrf-token']}
+            )
+            latency = time.perf_counter() - start
+            with lock:
+                statuses[date][response.status_code] += 1
+                latencies.append(latency)
+
+    threads = [threading.Thread(target=worker, args=(email,)) for email in emails]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        booked = collections.Counter(
+            date.isoformat() for date, in db.session.query(KotbarReservation.date)
+        )
+
+    failures = [
+        date for date in dates
+        if statuses[date][200] != 1 or booked[date] != 1
+        or statuses[date][400] != args.threads - 1
+    ]
+    print(json.dumps({
+        'environment': common.environment(),
+        'threads': args.threads,
+        'dates': args.dates,
+        'result': common.summarize(latencies, elapsed),
+        'statuses': {date: dict(statuses[date]) for date in dates},
+        'failures': failures,
+    }, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Listing query check: requests the reservation listings and the kotbar
+overview at growing numbers of reservations and fails if the number of
+executed statements changes with the number of rows (an N+1 query).
+
+Run from the repository root:
+
+    python -m benchmarks.listings [--sizes N ...]
+"""
+import argparse
+import datetime
+import json
+import sys
+
+from app import app, db, security
+from app.models import (
+    KotbarReservation, MaterialReservation, MaterialType, User,
+    association_material_reservation_items
+)
+from app.response_cache import response_cache
+from . import common
+
+PASSWORD = 'benchmark-password'
+ENDPOINTS = ['/api/kotbar/', '/api/materiaal/']
+
+
+def seed(start, count, user_ids, type_ids):
+    """
+    Inserts kotbar and material reservations on the given number of days
+    after the given start day, spread over the given users. Every material
+    reservation books two material types.
+    """
+    today = datetime.date.today()
+    now = datetime.datetime.utcnow()
+    days = range(start + 1, start + count + 1)
+    with app.app_context():
+        db.session.execute(KotbarReservation.__table__.insert(), [{
+            'user_id': user_ids[day % len(user_ids)],
+            'date': today + datetime.timedelta(days=day),
+            'description': 'reservation {}'.format(day),
+            'updated_at': now,
+        } for day in days])
+        db.session.execute(MaterialReservation.__table__.insert(), [{
+            'user_id': user_ids[day % len(user_ids)],
+            'date': today + datetime.timedelta(days=day),
+            'updated_at': now,
+        } for day in days])
+        reservation_ids = db.session.query(MaterialReservation.id) \
+                                    .order_by(MaterialReservation.id.desc()) \
+                                    .limit(count)
+        db.session.execute(association_material_reservation_items.insert(), [{
+            'reservation_id': reservation_id,
+            'type_id': type_ids[(reservation_id + i) % len(type_ids)],
+        } for reservation_id, in reservation_ids for i in range(2)])
+        db.session.commit()
+
+
+def count_requests(client):
+    """
+    Returns the number of statements executed by every listing request.
+    """
+    token = app.config['TOKEN_KOTBAR_RESERVATIONS']
+    urls = ENDPOINTS + ['/token/kotbar_reservations/{}'.format(token)]
+    counts = {}
+    for url in urls:
+        # Warms up the identity cache, which is not part of the listing
+        client.get(url)
+        # Cached pages would hide the statements of the listing
+        response_cache.clear()
+        with common.count_statements() as statements:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError('{} answered {}'.format(url, response.status_code))
+        counts[url] = len(statements)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    common.setup_database(args.database_uri)
+    app.config['TOKEN_KOTBAR_RESERVATIONS'] = 'benchmark-token'
+    # Logging in is not measured, so cheap hashes keep the setup fast
+    security.configure_password_hashing(dict(
+        app.config, ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024,
+        ARGON2_PARALLELISM=1, PASSWORD_HASH_QUEUE_TIMEOUT=None
+    ))
+    emails = common.seed_users(
+        args.users, security.generate_password_hash(PASSWORD)
+    )
+    with app.app_context():
+        db.session.execute(MaterialType.__table__.insert(), [
+            {'name': 'type {}'.format(i)} for i in range(4)
+        ])
+        db.session.commit()
+        user_ids = [user_id for user_id, in db.session.query(User.id)]
+        type_ids = [type_id for type_id, in db.session.query(MaterialType.id)]
+
+    client = app.test_client()
+    response = client.post(
+        '/api/auth/login', json={'email': emails[0], 'password': PASSWORD}
+    )
+    client.environ_base['HTTP_X_CSRF_TOKEN'] = response.json['a-csrf-token']
+
+    results = {}
+    seeded = 0
+    for size in sorted(set(args.sizes)):
+        seed(seeded, size - seeded, user_ids, type_ids)
+        seeded = size
+        results[size] = count_requests(client)
+
+    failures = [
+        url for url in results[seeded]
+        if len(set(counts[url] for counts in results.values())) > 1
+    ]
+    print(json.dumps({
+        'environment': common.environment(),
+        'statements': results,
+        'failures': failures,
+    }, indent=2))
+    if failures:
+        sys.exit('The number of statements depends on the number of rows')
+
+
+if __name__ == '__main__':
+    main()
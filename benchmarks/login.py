@@ -0,0 +1,175 @@
+"""
+Login throughput benchmark: measures /api/auth/login, /api/auth/refresh and an
+authenticated GET against a local SQLite database seeded with synthetic users,
+for several argon2 parameter sets and worker thread counts.
+
+Run from the repository root:
+
+    python -m benchmarks.login [--argon2 TIME,MEMORY,PARALLELISM ...]
+                               [--workers N ...] [--requests N] [--output FILE]
+
+Results are printed (or written) as JSON, so runs on different commits can be
+compared.
+"""
+import argparse
+import json
+import random
+import time
+
+import flask_jwt_extended as jwt
+from flask import jsonify
+
+from app import app, security
+from . import common
+
+PASSWORD = 'benchmark-password'
+
+
+def parse_argon2(value):
+    time_cost, memory_cost, parallelism = map(int, value.split(','))
+    return {
+        'ARGON2_TIME_COST': time_cost,
+        'ARGON2_MEMORY_COST': memory_cost,
+        'ARGON2_PARALLELISM': parallelism,
+    }
+
+
+def measure_components(iterations):
+    """
+    Returns the mean cost (in milliseconds) of the individual steps of a login.
+    """
+    password_hash = security.generate_password_hash(PASSWORD)
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return (time.perf_counter() - start) / iterations * 1000
+
+    with app.test_request_context():
+        access_token = jwt.create_access_token(identity=1)
+        refresh_token = jwt.create_refresh_token(identity=1)
+        return {
+            'check_password_ms': timed(
+                lambda: security.check_password_hash(password_hash, PASSWORD)
+            ),
+            'create_tokens_ms': timed(lambda: (
+                jwt.create_access_token(identity=1),
+                jwt.create_refresh_token(identity=1)
+            )),
+            'get_csrf_tokens_ms': timed(lambda: (
+                jwt.get_csrf_token(access_token),
+                jwt.get_csrf_token(refresh_token)
+            )),
+            'set_cookies_ms': timed(lambda: (
+                jwt.set_access_cookies(jsonify({}), access_token),
+                jwt.set_refresh_cookies(jsonify({}), refresh_token)
+            )),
+        }
+
+
+def login(client, email):
+    response = client.post(
+        '/api/auth/login', json={'email': email, 'password': PASSWORD}
+    )
+    return response
+
+
+def benchmark_endpoints(emails, workers, requests):
+    """
+    Returns the load results of the login, refresh and authenticated GET
+    endpoints with the given number of worker threads.
+    """
+    def anonymous():
+        return app.test_client()
+
+    def authenticated():
+        client = app.test_client()
+        response = login(client, random.choice(emails))
+        return client, response.json
+
+    def do_login(client):
+        return login(client, random.choice(emails)).status_code
+
+    def do_refresh(state):
+        client, tokens = state
+        return client.post(
+            '/api/auth/refresh',
+            headers={'X-CSRF-TOKEN': tokens['r-csrf-token']}
+        ).status_code
+
+    def do_get(state):
+        client, tokens = state
+        return client.get(
+            '/api/user/profile',
+            headers={'X-CSRF-TOKEN': tokens['a-csrf-token']}
+        ).status_code
+
+    return {
+        'login': common.run_load(anonymous, do_login, workers, requests),
+        'refresh': common.run_load(authenticated, do_refresh, workers, requests),
+        'profile': common.run_load(authenticated, do_get, workers, requests),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--argon2', type=parse_argon2, action='append',
+        help='argon2 cost parameters as TIME,MEMORY,PARALLELISM'
+    )
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument(
+        '--hash-workers', type=int, default=None,
+        help='size of the password hashing pool (default: as configured)'
+    )
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    parameter_sets = args.argon2 or [
+        {key: app.config[key] for key in (
+            'ARGON2_TIME_COST', 'ARGON2_MEMORY_COST', 'ARGON2_PARALLELISM'
+        )}
+    ]
+
+    common.setup_database(args.database_uri)
+    app.config['PASSWORD_HASH_QUEUE_TIMEOUT'] = None
+    if args.hash_workers is not None:
+        app.config['PASSWORD_HASH_WORKERS'] = args.hash_workers
+
+    results = []
+    for i, parameters in enumerate(parameter_sets):
+        config = dict(app.config, **parameters)
+        security.configure_password_hashing(config)
+
+        # Every parameter set gets its own users, hashed with its parameters
+        password_hash = security.generate_password_hash(PASSWORD)
+        emails = common.seed_users(
+            args.users, password_hash, prefix='set{}-user'.format(i)
+        )
+
+        for workers in args.workers:
+            results.append({
+                'argon2': parameters,
+                'hash_workers': config['PASSWORD_HASH_WORKERS'],
+                'workers': workers,
+                'components': measure_components(5),
+                'endpoints': benchmark_endpoints(emails, workers, args.requests),
+            })
+
+    output = json.dumps({
+        'environment': common.environment(),
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Connection pool load test: runs authenticated requests against endpoints which
+query the database from as many threads as the pool is sized for (and more),
+and reports the latencies and the pool statistics. At the configured
+concurrency no checkout should time out.
+
+Run from the repository root:
+
+    python -m benchmarks.pool [--threads N ...] [--requests N]
+                              [--database-uri URI]
+"""
+import argparse
+import datetime
+import json
+import random
+
+from app import app, db, security
+from app.database import pool_stats
+from app.models import KotbarReservation
+from . import common
+
+PASSWORD = 'benchmark-password'
+ENDPOINTS = ['/api/kotbar/', '/api/materiaal/', '/api/bread/', '/api/user/all']
+
+
+def seed(users):
+    """
+    Inserts the given number of users and a kotbar reservation for each.
+    Returns the email addresses of the users.
+    """
+    emails = common.seed_users(users, security.generate_password_hash(PASSWORD))
+    today = datetime.date.today()
+    with app.app_context():
+        db.session.execute(KotbarReservation.__table__.insert(), [
+            {'user_id': i + 1, 'date': today + datetime.timedelta(days=i),
+             'description': 'benchmark'}
+            for i in range(users)
+        ])
+        db.session.commit()
+    return emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, nargs='+', default=None)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    common.setup_database(args.database_uri)
+    # Logging in is not measured, so cheap hashes keep the setup fast
+    security.configure_password_hashing(dict(
+        app.config, ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024,
+        ARGON2_PARALLELISM=1, PASSWORD_HASH_QUEUE_TIMEOUT=None
+    ))
+    emails = seed(args.users)
+
+    with app.app_context():
+        engine = db.engine
+        pool_size = pool_stats(engine).get('size')
+    threads = args.threads or [app.config['WSGI_THREADS'], 2 * app.config['WSGI_THREADS']]
+
+    def authenticated():
+        client = app.test_client()
+        tokens = client.post(
+            '/api/auth/login',
+            json={'email': random.choice(emails), 'password': PASSWORD}
+        ).json
+        return client, tokens
+
+    def request(state):
+        client, tokens = state
+        return client.get(
+            random.choice(ENDPOINTS),
+            headers={'X-CSRF-TOKEN': tokens['a-csrf-token']}
+        ).status_code
+
+    results = []
+    for workers in threads:
+        before = pool_stats(engine)
+        result = common.run_load(authenticated, request, workers, args.requests)
+        after = pool_stats(engine)
+        result['pool'] = {
+            key: after[key] - before[key]
+            for key in ('checkouts', 'waits', 'timeouts', 'wait_seconds_total')
+        }
+        result['pool']['wait_seconds_max'] = after['wait_seconds_max']
+        results.append(dict(workers=workers, **result))
+
+    print(json.dumps({
+        'environment': common.environment(),
+        'database': engine.dialect.name,
+        'pool_size': pool_size,
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Serving benchmark: compares the development server of run.py with gunicorn
+(gunicorn.conf.py) on the same machine, by running authenticated requests
+over HTTP against both servers in turn with the same database.
+
+Run from the repository root:
+
+    python -m benchmarks.serve [--threads N ...] [--requests N]
+                               [--workers N] [--server-threads N]
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from app import app, security
+from . import common
+
+PASSWORD = 'benchmark-password'
+ENDPOINTS = ['/api/kotbar/', '/api/materiaal/', '/api/bread/type', '/api/user/profile']
+
+# Imported by both servers, points the application to the benchmark database
+WSGI_MODULE = '''
+from app import app, security
+
+app.config['SQLALCHEMY_DATABASE_URI'] = {database_uri!r}
+app.config['JWT_COOKIE_SECURE'] = False
+app.config['MAIL_SUPPRESS_SEND'] = True
+app.config['SQL_SLOW_QUERY_THRESHOLD'] = None
+security.configure_password_hashing(dict(
+    app.config, ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024,
+    ARGON2_PARALLELISM=1, PASSWORD_HASH_QUEUE_TIMEOUT=None
+))
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    """
+    Waits until the server accepts connections on the given port.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Server on port {} did not start'.format(port))
+
+
+def server_commands(port, workers, threads):
+    """
+    Returns the commands which start the compared servers on the given port.
+    """
+    return {
+        'run.py': [
+            sys.executable, '-c',
+            'from bench_wsgi import app; '
+            'app.run(host="127.0.0.1", port={}, threaded=True, debug=True, '
+            'use_reloader=False)'.format(port)
+        ],
+        'gunicorn': [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+            '--bind', '127.0.0.1:{}'.format(port),
+            '--workers', str(workers), '--threads', str(threads),
+            'bench_wsgi:app'
+        ],
+    }
+
+
+def benchmark_server(port, emails, threads, requests):
+    """
+    Returns the load results of the server on the given port for every number
+    of client threads.
+    """
+    base_url = 'http://127.0.0.1:{}'.format(port)
+
+    def authenticated():
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        login = urllib.request.Request(
+            base_url + '/api/auth/login',
+            data=json.dumps({
+                'email': random.choice(emails), 'password': PASSWORD
+            }).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        with opener.open(login) as response:
+            tokens = json.load(response)
+        return opener, tokens['a-csrf-token']
+
+    def request(state):
+        opener, csrf_token = state
+        request = urllib.request.Request(
+            base_url + random.choice(ENDPOINTS),
+            headers={'X-CSRF-TOKEN': csrf_token}
+        )
+        try:
+            with opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as err:
+            return err.code
+
+    return [
+        dict(client_threads=workers, **common.run_load(
+            authenticated, request, workers, requests
+        ))
+        for workers in threads
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=app.config['WSGI_WORKERS'])
+    parser.add_argument(
+        '--server-threads', type=int, default=app.config['WSGI_THREADS']
+    )
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    # Both servers share a SQLite file, since an in memory database is not
+    # shared between processes
+    database_uri = common.setup_database()
+    # Logging in is not measured, so cheap hashes keep the setup fast
+    security.configure_password_hashing(dict(
+        app.config, ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024,
+        ARGON2_PARALLELISM=1, PASSWORD_HASH_QUEUE_TIMEOUT=None
+    ))
+    emails = common.seed_users(
+        args.users, security.generate_password_hash(PASSWORD)
+    )
+
+    module_dir = tempfile.mkdtemp(prefix='lerkeveld-serve-')
+    with open(os.path.join(module_dir, 'bench_wsgi.py'), 'w') as f:
+        f.write(WSGI_MODULE.format(database_uri=database_uri))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([module_dir, os.getcwd()])
+
+    port = free_port()
+    results = {}
+    commands = server_commands(port, args.workers, args.server_threads)
+    for name, command in commands.items():
+        server = subprocess.Popen(
+            command, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for(port)
+            results[name] = benchmark_server(
+                port, emails, args.threads, args.requests
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({
+        'environment': common.environment(),
+        'gunicorn': {
+            'workers': args.workers,
+            'threads': args.server_threads,
+        },
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
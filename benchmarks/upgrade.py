@@ -0,0 +1,179 @@
+"""
+Schema upgrade check: creates a database with the schema of the first
+release, fills it with a few rows and runs the schema upgrade once. Fails if
+the upgrade raises, or if the upgraded database misses a column or index of
+the models, or if a hot query is answered with a sequential scan afterwards.
+
+Run from the repository root:
+
+    python -m benchmarks.upgrade [--database-uri URI]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+
+import sqlalchemy as sqla
+
+from app import app, db
+from app.commands import check_query_plans, upgrade_schema
+from . import common
+
+# The tables of the first release, without any of the later columns and
+# indexes
+BASELINE = sqla.MetaData()
+
+sqla.Table(
+    'user', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('first_name', sqla.String(64), nullable=False),
+    sqla.Column('last_name', sqla.String(64), nullable=False),
+    sqla.Column('email', sqla.String(128), unique=True, nullable=False),
+    sqla.Column('phone', sqla.String(16)),
+    sqla.Column('corridor', sqla.String(4)),
+    sqla.Column('room', sqla.String(8)),
+    sqla.Column('is_admin', sqla.Boolean, nullable=False),
+    sqla.Column('is_activated', sqla.Boolean, nullable=False),
+    sqla.Column('is_sharing', sqla.Boolean, nullable=False),
+    sqla.Column('is_member', sqla.Boolean),
+    sqla.Column('password_hash', sqla.String(128), nullable=False),
+)
+sqla.Table(
+    'group', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('name', sqla.String, nullable=False, unique=True),
+)
+sqla.Table(
+    'association_user_group', BASELINE,
+    sqla.Column('user_id', sqla.Integer, sqla.ForeignKey('user.id')),
+    sqla.Column('group_id', sqla.Integer, sqla.ForeignKey('group.id')),
+)
+sqla.Table(
+    'kotbar_reservation', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('user_id', sqla.Integer, sqla.ForeignKey('user.id')),
+    sqla.Column('date', sqla.Date, nullable=False),
+    sqla.Column('description', sqla.String, nullable=False),
+)
+sqla.Table(
+    'material_reservation', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('user_id', sqla.Integer, sqla.ForeignKey('user.id')),
+    sqla.Column('date', sqla.Date, nullable=False),
+)
+sqla.Table(
+    'material_type', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('name', sqla.String, nullable=False),
+)
+sqla.Table(
+    'association_material_type', BASELINE,
+    sqla.Column('reservation_id', sqla.Integer,
+                sqla.ForeignKey('material_reservation.id')),
+    sqla.Column('type_id', sqla.Integer, sqla.ForeignKey('material_type.id')),
+)
+sqla.Table(
+    'bread_order_date', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('date', sqla.Date, nullable=False),
+    sqla.Column('is_active', sqla.Boolean, nullable=False),
+)
+sqla.Table(
+    'bread_type', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('name', sqla.String, nullable=False),
+    sqla.Column('price', sqla.Integer, nullable=False),
+)
+sqla.Table(
+    'bread_order', BASELINE,
+    sqla.Column('id', sqla.Integer, primary_key=True),
+    sqla.Column('user_id', sqla.Integer, sqla.ForeignKey('user.id')),
+    sqla.Column('date_id', sqla.Integer, sqla.ForeignKey('bread_order_date.id')),
+    sqla.Column('type_id', sqla.Integer, sqla.ForeignKey('bread_type.id')),
+)
+
+
+def seed(engine):
+    """
+    Creates the tables of the first release and inserts a few rows in the
+    tables which get new columns.
+    """
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    tables = BASELINE.tables
+    BASELINE.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(tables['user'].insert(), [{
+            'id': 1, 'first_name': 'User', 'last_name': '1',
+            'email': 'user1@example.com', 'is_admin': False,
+            'is_activated': True, 'is_sharing': False, 'password_hash': 'x',
+        }])
+        connection.execute(tables['kotbar_reservation'].insert(), [
+            {'user_id': 1, 'date': tomorrow, 'description': 'reservation'},
+        ])
+        connection.execute(tables['material_reservation'].insert(), [
+            {'user_id': 1, 'date': tomorrow},
+        ])
+        connection.execute(tables['bread_order_date'].insert(), [
+            {'id': 1, 'date': tomorrow, 'is_active': True},
+        ])
+        connection.execute(tables['bread_type'].insert(), [
+            {'id': 1, 'name': 'bread', 'price': 100},
+        ])
+        connection.execute(tables['bread_order'].insert(), [
+            {'user_id': 1, 'date_id': 1, 'type_id': 1},
+        ])
+
+
+def find_missing(engine):
+    """
+    Returns the columns and indexes of the models which are missing in the
+    database.
+    """
+    inspector = sqla.inspect(engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(
+            '{}.{}'.format(table.name, column.name)
+            for column in table.columns if column.name not in columns
+        )
+        missing.extend(index.name for index in table.indexes
+                       if index.name not in indexes)
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database-uri', default=None,
+                        help='An empty database (default: a new SQLite database)')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri
+    if database_uri is None:
+        directory = tempfile.mkdtemp(prefix='lerkeveld-upgrade-')
+        database_uri = 'sqlite:///' + os.path.join(directory, 'upgrade.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+
+    with app.app_context():
+        seed(db.engine)
+        changes = upgrade_schema()
+        missing = find_missing(db.engine)
+        scans = [
+            result['name'] for result in check_query_plans() if result['scans']
+        ]
+
+    print(json.dumps({
+        'environment': common.environment(),
+        'changes': changes,
+        'missing': missing,
+        'scans': scans,
+    }, indent=2))
+    if missing or scans:
+        sys.exit('The upgraded database does not match the models')
+
+
+if __name__ == '__main__':
+    main()
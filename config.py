@@ -11,6 +11,57 @@ PROPAGATE_EXCEPTIONS = True
 SQLALCHEMY_DATABASE_URI = ''
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# database engine (the pool size defaults to WSGI_THREADS, times in seconds)
+DATABASE_POOL_SIZE = None
+DATABASE_MAX_OVERFLOW = 2
+DATABASE_POOL_TIMEOUT = 10
+DATABASE_POOL_PRE_PING = True
+DATABASE_POOL_RECYCLE = 30 * 60
+DATABASE_STATEMENT_TIMEOUT = 30
+DATABASE_CONNECT_TIMEOUT = 10
+DATABASE_KEEPALIVES_IDLE = 60
+DATABASE_KEEPALIVES_INTERVAL = 10
+DATABASE_KEEPALIVES_COUNT = 5
+
+# wsgi server (see gunicorn.conf.py, times in seconds)
+WSGI_BIND = '127.0.0.1:8000'
+WSGI_WORKERS = 2
+WSGI_THREADS = 4
+WSGI_TIMEOUT = 30
+WSGI_GRACEFUL_TIMEOUT = 30
+WSGI_MAX_REQUESTS = 0
+
+# sql instrumentation (slow query threshold in seconds, None disables the log)
+SQL_SLOW_QUERY_THRESHOLD = 0.25
+SQL_SERVER_TIMING = False
+SQL_STATS_FILE = None
+
+# metrics (directory shared by the worker processes, None for a single process)
+METRICS_DIR = None
+METRICS_WRITE_INTERVAL = 5
+
+# argon2 password hashing
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 102400
+ARGON2_PARALLELISM = 8
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE_TIMEOUT = 5
+
+# cache (memory, filesystem or import path of a cache class)
+CACHE_TYPE = 'memory'
+CACHE_DIR = None
+
+# response cache for read-mostly endpoints (default time to live)
+RESPONSE_CACHE_TTL = 5 * 60
+RESPONSE_CACHE_SIZE = 256
+
+# catalog (bread types) name lookups
+CATALOG_CACHE_TTL = 5 * 60
+
+# identity cache for the user of a request
+IDENTITY_CACHE_TTL = 5 * 60
+IDENTITY_CACHE_SIZE = 1024
+
 # flask_jwt_extended
 JWT_TOKEN_LOCATION = ['cookies']
 JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(hours=1)
@@ -37,15 +88,41 @@ CORS_VARY_HEADER = True
 # flask_mail
 MAIL_SUPPRESS_SEND = True
 
+# mailer (background email delivery)
+MAIL_WORKERS = 2
+MAIL_QUEUE_SIZE = 100
+MAIL_QUEUE_TIMEOUT = 1
+MAIL_MAX_RETRIES = 3
+MAIL_RETRY_BACKOFF = 1
+MAIL_SHUTDOWN_TIMEOUT = 30
+MAIL_BATCH_SIZE = 10
+MAIL_POOL_SIZE = 2
+MAIL_POOL_IDLE_TIMEOUT = 60
+MAIL_POOL_CHECK_INTERVAL = 10
+
 # mailinglist
 MAIL_KOTBAR_ADMIN = []
 MAIL_MATERIAAL_ADMIN = []
 
+# user directory (default and maximum number of users per page)
+USER_DIRECTORY_PAGE_SIZE = 500
+
+# materiaal availability
+MATERIAAL_AVAILABILITY_MAX_DAYS = 62
+
+# bread report
+BREAD_REPORT_CACHE_TTL = 60 * 60
+BREAD_REPORT_CACHE_SIZE = 32
+BREAD_REPORT_MAX_DAYS = 366
+
 # kotbar reservations
 TOKEN_KOTBAR_RESERVATIONS = os.urandom(64)
 
 # bem overview
 TOKEN_BREAD_RESERVATIONS = os.urandom(64)
 
+# metrics endpoint (bearer token)
+TOKEN_METRICS = os.urandom(64)
+
 # itsdangerous
 TOKEN_MAX_AGE = 2 * 24 * 60 * 60
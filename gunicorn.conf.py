@@ -0,0 +1,41 @@
+"""
+The gunicorn configuration, read from the WSGI_* settings of config.py and
+secret.py:
+
+    env/bin/gunicorn -c gunicorn.conf.py wsgi:app
+
+The application is loaded once in the master process and forked into
+WSGI_WORKERS worker processes with WSGI_THREADS threads each. On SIGTERM the
+workers stop accepting requests, finish the requests in flight and deliver
+the queued emails before they exit.
+"""
+import os
+
+from flask import Config
+
+# Not named config, which is a gunicorn setting
+settings = Config(os.path.dirname(os.path.abspath(__file__)))
+settings.from_object('config')
+settings.from_object('secret')
+
+bind = settings['WSGI_BIND']
+workers = settings['WSGI_WORKERS']
+threads = settings['WSGI_THREADS']
+worker_class = 'gthread'
+preload_app = True
+timeout = settings['WSGI_TIMEOUT']
+graceful_timeout = settings['WSGI_GRACEFUL_TIMEOUT']
+max_requests = settings['WSGI_MAX_REQUESTS']
+max_requests_jitter = settings['WSGI_MAX_REQUESTS'] // 10
+
+
+def pre_fork(server, worker):
+    # Connections opened by the master must not be shared with the workers
+    from app import db
+    db.engine.dispose()
+
+
+def worker_exit(server, worker):
+    # Deliver the queued emails before the worker exits
+    from app import mailer
+    mailer.close(settings['MAIL_SHUTDOWN_TIMEOUT'])
@@ -0,0 +1,7 @@
+"""
+The WSGI entry point for production servers, e.g. gunicorn (see
+gunicorn.conf.py):
+
+    env/bin/gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app